@@ -41,12 +41,32 @@ INSTALLED_APPS = [
     'rest_framework',
 ]
 
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'store.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    # orjson / MessagePack renderers are used when their optional packages are installed.
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'store.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'store.renderers.ContentNegotiation',
+}
+
+# Upper bound for the ?page_size= query parameter of list endpoints.
+PAGINATION_MAX_PAGE_SIZE = 500
+
+# Most operations accepted by one request to /product/batch/.
+PRODUCT_BATCH_MAX_SIZE = 1000
+
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,11 +97,50 @@ WSGI_APPLICATION = 'nappstore.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # SQLite with the pragmas below on every connection and BEGIN IMMEDIATE for the
+        # cart and stock writes (store.sqlite), so concurrent writers queue instead of failing.
+        'ENGINE': 'store.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 268435456,  # 256 MiB
+            'cache_size': -65536,  # 64 MiB
+            'busy_timeout': 5000,
+        },
     }
 }
 
+# Aliases of read replicas of the default database. Catalog lists and details are read from
+# one of them (store.routers); after a write, the client reads from the primary for
+# DATABASE_REPLICA_LAG_SECONDS. With a copy of db.sqlite3 kept up to date, e.g. by LiteFS:
+#     DATABASES['replica'] = dict(DATABASES['default'], NAME=BASE_DIR / 'replica.sqlite3')
+#     DATABASE_REPLICAS = ['replica']
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_LAG_SECONDS = 5
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Product list and detail responses, see store.cache. MAX_ENTRIES bounds its size.
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+CATALOG_CACHE_ALIAS = 'catalog'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -134,3 +193,19 @@ EMAIL_USE_TLS = True
 EMAIL_PORT = 587
 EMAIL_HOST_USER = "jv@gmail.com"
 EMAIL_HOST_PASSWORD = "secret"
+
+# Outbox delivery (send_outbox command): failed emails are retried with exponential backoff.
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_SECONDS = 60
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+OUTBOX_LEASE_SECONDS = 300
+
+# Open carts untouched for this long are deleted by the sweep_carts command, which gives their stock back.
+CART_TTL_SECONDS = 60 * 60 * 24
+
+# Request metrics served at /metrics (store.metrics). With several worker processes, point
+# METRICS_DIR to a directory they share, emptied at deploy time, so /metrics adds them up.
+METRICS_DIR = None
+METRICS_FLUSH_SECONDS = 5
+# /metrics is staff only; when set, it is also served to "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = None
@@ -17,7 +17,9 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
 
-from store.views import CategoryViewSet, ProductViewSet, CartViewSet, ProductDelete, ProductUpdate, CartUpdate, CustomerViewSet
+from store import async_views
+from store.views import CategoryViewSet, ProductViewSet, CartViewSet, ProductDelete, ProductUpdate, CartUpdate, CustomerViewSet, \
+    CatalogExport, OrderExport, MetricsView
 
 router = routers.DefaultRouter()
 router.register(r'category', CategoryViewSet)
@@ -34,6 +36,12 @@ urlpatterns = [
     path('cart/<str:pk>/update', CartUpdate.as_view()),
     path('product/<int:pk>/delete', ProductDelete.as_view()),
     path('product/<int:pk>/update', ProductUpdate.as_view()),
+    path('export/catalog.<str:export_format>', CatalogExport.as_view()),
+    path('export/orders.<str:export_format>', OrderExport.as_view()),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('async/product/', async_views.product_list, name='async-product-list'),
+    path('async/product/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/carts/<uuid:pk>/', async_views.cart_detail, name='async-cart-detail'),
     path('api-auth/', include('rest_framework.urls')),
 ]
 
@@ -1,24 +1,48 @@
 from django.contrib import admin
-from .models import Product, Category, Cart, CartItem, Customer
+from .models import Product, Category, Cart, CartItem, Customer, OutboxEmail, StockMovement
 
 
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'created', 'completed')
-    search_fields = ('created', 'completed')
+    list_display = ('id', 'owner', 'created', 'completed', 'item_count', 'total_amount')
+    search_fields = ('owner', 'created', 'completed')
+
+    # Delete one by one so every open cart gives its stock back.
+    def delete_queryset(self, request, queryset):
+        for cart in queryset:
+            cart.delete()
 
 
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('cart', 'product', 'quantity')
     search_fields = ('cart', 'product')
 
+    # Delete one by one so every item gives its stock back.
+    def delete_queryset(self, request, queryset):
+        for cart_item in queryset.select_related('cart'):
+            cart_item.delete()
+
 
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('description', 'brand', 'price', 'current_stock', 'inclusion_date', 'is_available')
+    list_display = ('description', 'brand', 'price', 'current_stock', 'stock_shards', 'inclusion_date', 'is_available')
     search_fields = ('brand',  'main_colourmain_colour', 'is_available')
 
 
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('product', 'kind', 'quantity', 'cart_ref', 'item_ref', 'created', 'compacted')
+    list_filter = ('kind', 'compacted')
+    search_fields = ('cart_ref',)
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt', 'sent')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+
+
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Category)
 admin.site.register(Cart, CartAdmin)
 admin.site.register(CartItem, CartItemAdmin)
 admin.site.register(Customer)
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+admin.site.register(StockMovement, StockMovementAdmin)
@@ -0,0 +1,57 @@
+"""
+Awaitable database and cache access for the async views. Django 3.2 has no async ORM nor
+async cache API, so queries run in a pool of worker threads (not thread sensitive), where
+concurrent requests wait for the database side by side instead of one after another.
+"""
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+
+# Its own pool rather than the event loop's, so the worker threads, and the one connection each
+# keeps per database, last as long as the process whichever loop runs the requests.
+executor = ThreadPoolExecutor(thread_name_prefix='aio')
+
+
+def database(function, *args, **kwargs):
+    """Awaitable that calls function(*args, **kwargs) in a worker thread."""
+    return sync_to_async(functools.partial(in_worker, function, *args, **kwargs), thread_sensitive=False,
+                         executor=executor)()
+
+
+def in_worker(function, *args, **kwargs):
+    reuse_connections()
+    return function(*args, **kwargs)
+
+
+def reuse_connections():
+    """
+    request_started/request_finished never run in the worker threads, so each call checks their
+    connections itself. They are reused from call to call, and closed when they broke or outlived
+    a CONN_MAX_AGE other than 0 (which means per request, and a worker outlives every request);
+    otherwise they are closed when their thread exits.
+    """
+    for connection in connections.all():
+        if connection.connection is not None and connection.settings_dict['CONN_MAX_AGE'] == 0:
+            connection.close_at = None
+        connection.close_if_unusable_or_obsolete()
+
+
+async def aget(queryset, *args, **kwargs):
+    """QuerySet.get() for async code: the row, with whatever the queryset prefetches."""
+    return await database(queryset.get, *args, **kwargs)
+
+
+async def aiterate(queryset):
+    """Rows of the queryset for `async for`; they are fetched in a single query."""
+    for row in await database(list, queryset):
+        yield row
+
+
+async def acache(cache, function, *args, **kwargs):
+    # The local memory cache never blocks, so it is used in place; other backends do I/O.
+    if isinstance(cache, LocMemCache):
+        return function(*args, **kwargs)
+    return await database(function, *args, **kwargs)
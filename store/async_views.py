@@ -0,0 +1,86 @@
+"""
+Async versions of the catalog and cart read endpoints, mounted under /async/. Under ASGI a
+request waiting for the database or the cache does not hold a worker thread. They answer
+the same JSON as the DRF endpoints, without content negotiation nor conditional GET.
+"""
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from .aio import acache, aget, aiterate, database
+from .cache import catalog_cache
+from .fast import compile_serializer
+from .models import Cart, Product
+from .renderers import FastJSONRenderer
+from .routers import read_from_replicas
+from .serializers import CartSerializer, ProductSerializer, plan_queryset
+from .views import ProductViewSet
+
+renderer = FastJSONRenderer()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(renderer.render(data), status=status_code, content_type=renderer.media_type)
+
+
+def not_found():
+    return json_response({'detail': "Not found."}, status.HTTP_404_NOT_FOUND)
+
+
+def api_view(view):
+    # DRF's query_params for the filters and the pagination, and its errors as JSON.
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(Request(request), *args, **kwargs)
+        except APIException as error:
+            return json_response(error.detail, error.status_code)
+    return wrapper
+
+
+async def product_page(request):
+    view = ProductViewSet(request=request, args=(), kwargs={}, action='list', format_kwarg=None)
+    compiled = compile_serializer(view.get_serializer_class())
+    paginator = view.paginator
+    ordering = paginator.get_ordering(request, view)
+    rows = compiled.rows(view.filter_queryset(view.get_queryset()), [field.lstrip('-') for field in ordering])
+    page = paginator.paginate_results([row async for row in aiterate(paginator.page_queryset(rows, request, view))])
+    # ?facets=true adds a query, the rest of the response is built in memory.
+    response = await database(view.get_paginated_response, compiled.data(page))
+    return response.data
+
+
+@api_view
+async def product_list(request):
+    read_from_replicas()
+    key, data = await acache(catalog_cache.cache, catalog_cache.get_list, request.get_full_path())
+    if data is None:
+        data = await product_page(request)
+        await acache(catalog_cache.cache, catalog_cache.set_list, key, data, ProductViewSet.cache_timeout())
+    return json_response(data)
+
+
+@api_view
+async def product_detail(request, pk):
+    read_from_replicas()
+    data = await acache(catalog_cache.cache, catalog_cache.get_product, pk)
+    if data is None:
+        compiled = compile_serializer(ProductSerializer)
+        try:
+            row = await aget(compiled.rows(Product.objects.filter(pk=pk), ['category_id']))
+        except Product.DoesNotExist:
+            return not_found()
+        version = await acache(catalog_cache.cache, catalog_cache.product_version, row.category_id)
+        data = compiled.data([row])[0]
+        await acache(catalog_cache.cache, catalog_cache.set_product, pk, row.category_id, version, data,
+                     ProductViewSet.cache_timeout())
+    return json_response(data)
+
+
+@api_view
+async def cart_detail(request, pk):
+    try:
+        cart = await aget(plan_queryset(Cart.objects.all(), CartSerializer), pk=pk)
+    except Cart.DoesNotExist:
+        return not_found()
+    return json_response(CartSerializer(cart).data)
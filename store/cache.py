@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+
+class CatalogCache:
+    """
+    Read-through cache for catalog responses. Entries are keyed by a catalog version
+    (list responses) or validated against their category version (product details),
+    so a write only has to bump a counter and stale entries are never served nor scanned.
+    """
+    global_version_key = 'catalog:version'
+    category_version_key = 'catalog:version:category:{}'
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _version(self, key):
+        version = self.cache.get(key)
+        if version is None:
+            # Versions start from the clock, so a version key that was evicted can never
+            # come back with a number that older entries were stored under.
+            version = time.time_ns()
+            if not self.cache.add(key, version, timeout=None):
+                version = self.cache.get(key, version)
+        return version
+
+    def _bump(self, keys):
+        for key in keys:
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self._version(key)
+
+    def bump(self, category_ids=()):
+        keys = [self.global_version_key] + [self.category_version_key.format(pk) for pk in set(category_ids)]
+        # Bump now to drop what is cached, and again after commit to drop whatever another
+        # request cached from the old rows while the transaction was still open.
+        self._bump(keys)
+        transaction.on_commit(lambda: self._bump(keys))
+
+    def get_list(self, path):
+        key = self._list_key(path)
+        data = self.cache.get(key)
+        self._count(data is not None)
+        return key, data
+
+    def set_list(self, key, data, timeout=DEFAULT_TIMEOUT):
+        self.cache.set(key, data, timeout)
+
+    def get_product(self, pk):
+        entry = self.cache.get(f'catalog:product:{pk}')
+        data = None
+        if entry is not None:
+            category_id, version, cached = entry
+            if version == self._version(self.category_version_key.format(category_id)):
+                data = cached
+        self._count(data is not None)
+        return data
+
+    def product_version(self, category_id):
+        return self._version(self.category_version_key.format(category_id))
+
+    def set_product(self, pk, category_id, version, data, timeout=DEFAULT_TIMEOUT):
+        self.cache.set(f'catalog:product:{pk}', (category_id, version, data), timeout)
+
+    def _list_key(self, path):
+        digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+        return f'catalog:{self._version(self.global_version_key)}:list:{digest}'
+
+
+catalog_cache = CatalogCache(getattr(settings, 'CATALOG_CACHE_ALIAS', 'catalog'))
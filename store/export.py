@@ -0,0 +1,86 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Cart, CartItem, Product
+
+CATALOG_FIELDS = ('id', 'sku', 'category', 'main_colour', 'second_colour', 'logo_colour', 'brand',
+                  'inclusion_date', 'url_img', 'price', 'current_stock', 'description', 'size', 'sizing',
+                  'fabric', 'sleeve')
+CART_FIELDS = ('id', 'created', 'updated', 'item_count', 'total_amount')
+ITEM_FIELDS = ('product_id', 'sku', 'description', 'price', 'quantity', 'sub_total')
+# Orders are nested in NDJSON (one cart per line) and flattened to one line per item in CSV.
+ORDER_CSV_FIELDS = ('cart_id',) + CART_FIELDS[1:] + ITEM_FIELDS
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+CHUNK_SIZE = 2000
+
+
+def catalog_rows(chunk_size=CHUNK_SIZE):
+    columns = ['category__name' if field == 'category' else field for field in CATALOG_FIELDS]
+    products = Product.objects.order_by('pk').values_list(*columns)
+    for row in products.iterator(chunk_size=chunk_size):
+        yield dict(zip(CATALOG_FIELDS, row))
+
+
+def order_rows(chunk_size=CHUNK_SIZE):
+    """Completed carts with their items, which are fetched with one query per chunk of carts."""
+    carts = Cart.objects.filter(completed=True).order_by('created', 'pk').values_list(*CART_FIELDS)
+    carts = carts.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [dict(zip(CART_FIELDS, row)) for row in islice(carts, chunk_size)]
+        if not chunk:
+            return
+        items = defaultdict(list)
+        lines = CartItem.objects.filter(cart_id__in=[cart['id'] for cart in chunk]).order_by('pk').values_list(
+            'cart_id', 'product_id', 'product__sku', 'product__description', 'product__price', 'quantity')
+        for cart_id, product_id, sku, description, price, quantity in lines:
+            items[cart_id].append({'product_id': product_id, 'sku': sku, 'description': description,
+                                   'price': price, 'quantity': quantity, 'sub_total': quantity * price})
+        for cart in chunk:
+            cart['items'] = items[cart['id']]
+            yield cart
+
+
+def flatten_order(cart):
+    for item in cart['items']:
+        yield dict({'cart_id': cart['id']}, **{field: cart[field] for field in CART_FIELDS[1:]}, **item)
+
+
+EXPORTS = {
+    'catalog': (catalog_rows, CATALOG_FIELDS, None),
+    'orders': (order_rows, ORDER_CSV_FIELDS, flatten_order),
+}
+
+
+class Echo:
+    # File-like target for csv.writer that hands back each line instead of buffering it.
+    def write(self, value):
+        return value
+
+
+def export_lines(name, export_format, chunk_size=CHUNK_SIZE):
+    rows, fields, flatten = EXPORTS[name]
+    rows = rows(chunk_size)
+    if export_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+        return
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        for line in flatten(row) if flatten else (row,):
+            yield writer.writerow([line[field] for field in fields])
+
+
+def export_chunks(name, export_format, chunk_size=CHUNK_SIZE):
+    """The export as UTF-8 byte strings of about chunk_size lines each."""
+    lines = export_lines(name, export_format, chunk_size)
+    while True:
+        chunk = ''.join(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk.encode('utf-8')
@@ -0,0 +1,102 @@
+from functools import lru_cache
+
+from rest_framework import serializers
+
+from .serializers import ProductSerializer, CapSerializer, TShirtSerializer, SimpleProductSerializer
+
+# Fields whose to_representation() returns database values unchanged: strings, numbers,
+# booleans and primary keys. Any other field keeps its own to_representation().
+IDENTITY_FIELDS = (serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+                   serializers.FloatField, serializers.BooleanField, serializers.StringRelatedField)
+
+
+class NotCompilable(Exception):
+    pass
+
+
+class CompiledSerializer:
+    """
+    Read-only plan of a ModelSerializer: the columns to load with values_list() and, for
+    each output field, the columns it reads and how to convert them. data() builds the same
+    dicts, in the same key order, as serializer(many=True).data.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer = serializer = serializer_class()
+        self.model = serializer_class.Meta.model
+        method_sources = getattr(serializer_class.Meta, 'method_sources', {})
+        self.annotations = sorted(set(getattr(serializer_class.Meta, 'annotations', {}).values()))
+        self.columns = []
+        self.fields = []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                sources = method_sources.get(field.field_name)
+                if sources is None or any('__' in source for source in sources):
+                    raise NotCompilable(f"{field.field_name} reads related objects")
+                indexes = [self.column(source) for source in sources]
+                self.fields.append((field.field_name, indexes, self.method(field, sources)))
+            elif isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)) or field.source == '*':
+                raise NotCompilable(f"{field.field_name} is nested")
+            elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.use_pk_only_optimization():
+                self.fields.append((field.field_name, self.column(field.source_attrs[0]), None))
+            elif isinstance(field, serializers.RelatedField) and not isinstance(field, serializers.StringRelatedField):
+                raise NotCompilable(f"{field.field_name} needs the related object")
+            else:
+                convert = None if isinstance(field, IDENTITY_FIELDS) else field.to_representation
+                source = getattr(field, 'read_source', None) or '__'.join(field.source_attrs)
+                self.fields.append((field.field_name, self.column(source), convert))
+        self.data = self.compile()
+
+    def column(self, path):
+        if path not in self.columns:
+            self.columns.append(path)
+        return self.columns.index(path)
+
+    def method(self, field, sources):
+        method = getattr(self.serializer, field.method_name)
+        model = self.model
+
+        def call(*values):
+            # A bare instance holding just the declared columns is enough for the method.
+            instance = model.__new__(model)
+            instance.__dict__.update(zip(sources, values))
+            return method(instance)
+        return call
+
+    def rows(self, queryset, extra=()):
+        """values_list() of the plan's columns, plus `extra` ones, as named tuples."""
+        columns = self.columns + [column for column in extra if column not in self.columns]
+        for method in self.annotations:
+            queryset = getattr(queryset, method)()
+        return queryset.values_list(*columns, named=True)
+
+    def compile(self):
+        # One list comprehension with a dict display per serializer: no per-field loop at all.
+        namespace, items = {}, []
+        for position, (name, index, convert) in enumerate(self.fields):
+            namespace[f'convert_{position}'] = convert
+            if isinstance(index, list):
+                value = f"convert_{position}({', '.join(f'row[{column}]' for column in index)})"
+            elif convert is None:
+                value = f'row[{index}]'
+            else:
+                value = f'(None if row[{index}] is None else convert_{position}(row[{index}]))'
+            items.append(f'{name!r}: {value}')
+        source = f"def data(rows):\n    return [{{{', '.join(items)}}} for row in rows]\n"
+        exec(compile(source, f'<compiled {type(self.serializer).__name__}>', 'exec'), namespace)
+        return namespace['data']
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    """The compiled plan of serializer_class, or None when it has fields that cannot be compiled."""
+    try:
+        return CompiledSerializer(serializer_class)
+    except NotCompilable:
+        return None
+
+
+for _serializer_class in (ProductSerializer, CapSerializer, TShirtSerializer, SimpleProductSerializer):
+    compile_serializer(_serializer_class)
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+from django.db.models import BooleanField, Case, Count, Value, When
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .constants import COLOURS, SIZE, SIZING, FABRIC, CATEGORIES_CHOICES
+
+# Query parameter -> (model lookup, allowed values). Several values are separated by commas.
+CHOICE_FILTERS = OrderedDict([
+    ('colour', ('main_colour', COLOURS)),
+    ('size', ('size', SIZE)),
+    ('sizing', ('sizing', SIZING)),
+    ('fabric', ('fabric', FABRIC)),
+    ('category', ('category__name', CATEGORIES_CHOICES)),
+])
+
+# ?ordering= value -> keyset used by the pagination. Every key ends with the id to be unique.
+ORDERINGS = {
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'inclusion_date': ('inclusion_date', 'id'),
+    '-inclusion_date': ('-inclusion_date', '-id'),
+}
+
+FACET_FIELDS = OrderedDict([
+    ('colour', 'main_colour'),
+    ('size', 'size'),
+    ('sizing', 'sizing'),
+    ('fabric', 'fabric'),
+    ('brand', 'brand'),
+    ('category', 'category__name'),
+    ('available', 'available'),
+])
+
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+
+def split_values(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_bool(name, value):
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise ValidationError({name: [f"'{value}' is not a valid boolean."]})
+
+
+def get_ordering(request, default):
+    ordering = request.query_params.get('ordering')
+    if ordering is None:
+        return default
+    if ordering not in ORDERINGS:
+        raise ValidationError({'ordering': [f"Choose one of {', '.join(sorted(ORDERINGS))}."]})
+    return ORDERINGS[ordering]
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Filters products by colour, size, sizing, fabric, brand, category, availability
+    (?available=true) and price range (?min_price= / ?max_price=).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filters = {}
+        for name, (lookup, choices) in CHOICE_FILTERS.items():
+            if name not in params:
+                continue
+            values = split_values(params[name])
+            allowed = {choice for choice, _ in choices}
+            invalid = [value for value in values if value not in allowed]
+            if invalid:
+                raise ValidationError({name: [f"'{value}' is not a valid choice." for value in invalid]})
+            filters[lookup + '__in'] = values
+
+        if 'brand' in params:
+            filters['brand__in'] = split_values(params['brand'])
+        if 'available' in params:
+            available = parse_bool('available', params['available'])
+            queryset = queryset.with_stock()
+            filters['stock__gt' if available else 'stock__lte'] = 0
+        for name, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+            if name in params:
+                try:
+                    filters[lookup] = float(params[name])
+                except ValueError:
+                    raise ValidationError({name: ["A valid number is required."]})
+
+        return queryset.filter(**filters)
+
+
+def facet_counts(queryset):
+    # All facets come from one GROUP BY over every facet column; each facet then
+    # sums the counts of the groups sharing its value.
+    rows = queryset.order_by().with_stock().annotate(
+        available=Case(When(stock__gt=0, then=Value(True)), default=Value(False),
+                       output_field=BooleanField()),
+    ).values(*FACET_FIELDS.values()).annotate(count=Count('pk'))
+
+    facets = OrderedDict((name, {}) for name in FACET_FIELDS)
+    for row in rows:
+        for name, column in FACET_FIELDS.items():
+            value = row[column]
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value = str(value).lower()
+            facets[name][value] = facets[name].get(value, 0) + row['count']
+    return facets
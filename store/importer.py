@@ -0,0 +1,224 @@
+import csv
+import json
+import re
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .constants import COLOURS, SIZE, SIZING, FABRIC, CATEGORIES_CHOICES
+from .models import Category, Product
+from .signals import products_changed
+from .stock import record_adjustments
+
+CHOICE_FIELDS = {
+    'main_colour': COLOURS,
+    'second_colour': COLOURS,
+    'logo_colour': COLOURS,
+    'size': SIZE,
+    'sizing': SIZING,
+    'fabric': FABRIC,
+}
+REQUIRED_FIELDS = ('sku', 'category', 'main_colour', 'second_colour', 'brand', 'url_img', 'price',
+                   'current_stock', 'description')
+OPTIONAL_FIELDS = ('logo_colour', 'size', 'sizing', 'fabric', 'sleeve', 'initial_stock')
+# Fields written when an existing product is updated. The initial stock is only set on creation.
+UPDATE_FIELDS = ('category', 'main_colour', 'second_colour', 'logo_colour', 'brand', 'url_img', 'price',
+                 'current_stock', 'description', 'size', 'sizing', 'fabric', 'sleeve', 'updated')
+FORMATS = ('json', 'ndjson', 'csv')
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+WHITESPACE_RE = re.compile(r'\s*')
+SEPARATOR_RE = re.compile(r'[\s,]*')
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(path):
+    extension = path.rsplit('.', 1)[-1].lower()
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    return extension if extension in FORMATS else None
+
+
+def read_json(stream, chunk_size=1 << 16):
+    """Yields the items of a top-level JSON array, reading the stream chunk by chunk."""
+    decoder = json.JSONDecoder()
+    buffer, position, eof, opened = '', 0, False, False
+    while True:
+        position = (SEPARATOR_RE if opened else WHITESPACE_RE).match(buffer, position).end()
+        if position < len(buffer):
+            if not opened:
+                if buffer[position] != '[':
+                    raise RowError("The JSON document must be an array.")
+                opened, position = True, position + 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise RowError("Invalid JSON near the end of the file.")
+            else:
+                yield item
+                position = end
+                continue
+        elif eof:
+            raise RowError("Unexpected end of the JSON document.")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield {key: value if value != '' else None for key, value in row.items()}
+
+
+READERS = {'json': read_json, 'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def _choice(name, value, choices):
+    if value is None:
+        return None
+    if value not in {choice for choice, _ in choices}:
+        raise RowError(f"{name}: '{value}' is not a valid choice.")
+    return value
+
+
+def _number(name, value, kind):
+    try:
+        number = kind(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{name}: a valid number is required.")
+    if number < 0:
+        raise RowError(f"{name}: must not be negative.")
+    return number
+
+
+def _bool(name, value):
+    if value is None or isinstance(value, bool):
+        return value
+    if str(value).lower() in TRUE_VALUES:
+        return True
+    if str(value).lower() in FALSE_VALUES:
+        return False
+    raise RowError(f"{name}: '{value}' is not a valid boolean.")
+
+
+def clean_row(row):
+    """Validates a raw row against the catalog choices and returns the product fields."""
+    if not isinstance(row, dict):
+        raise RowError("Each row must be an object.")
+    missing = [name for name in REQUIRED_FIELDS if row.get(name) in (None, '')]
+    if missing:
+        raise RowError(f"Missing fields: {', '.join(missing)}.")
+    unknown = set(row) - set(REQUIRED_FIELDS) - set(OPTIONAL_FIELDS)
+    if unknown:
+        raise RowError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+
+    fields = {name: _choice(name, row.get(name), choices) for name, choices in CHOICE_FIELDS.items()}
+    fields.update(
+        sku=str(row['sku']),
+        category=_choice('category', row['category'], CATEGORIES_CHOICES),
+        brand=str(row['brand']),
+        url_img=str(row['url_img']),
+        description=str(row['description']),
+        price=_number('price', row['price'], float),
+        current_stock=_number('current_stock', row['current_stock'], int),
+    )
+    if row.get('sleeve') is not None:
+        fields['sleeve'] = _bool('sleeve', row['sleeve'])
+    if row.get('initial_stock') is not None:
+        fields['initial_stock'] = _number('initial_stock', row['initial_stock'], int)
+    return fields
+
+
+class CatalogImporter:
+    """
+    Upserts products on their SKU. Rows are validated one by one and written per chunk,
+    each chunk in its own transaction with one lookup, one bulk_create and one bulk_update.
+    """
+
+    def __init__(self, batch_size=1000, max_errors=20):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.created = self.updated = self.rows = self.invalid = 0
+        # Only the first max_errors invalid rows are kept, so that memory stays bounded.
+        self.errors = []
+        self.elapsed = 0
+        self.categories = {}
+
+    def run(self, rows, progress=None):
+        started = time.monotonic()
+        chunk = {}
+        for number, row in enumerate(rows, 1):
+            self.rows += 1
+            try:
+                fields = clean_row(row)
+            except RowError as error:
+                self.invalid += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append((number, str(error)))
+                continue
+            # A SKU repeated within a chunk is written once, with its last row.
+            chunk[fields['sku']] = fields
+            if len(chunk) >= self.batch_size:
+                self.write(chunk)
+                chunk = {}
+                if progress:
+                    self.elapsed = time.monotonic() - started
+                    progress(self)
+        if chunk:
+            self.write(chunk)
+        self.elapsed = time.monotonic() - started
+        return self
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+    def category_id(self, name):
+        if name not in self.categories:
+            category = Category.objects.filter(name=name).order_by('pk').first()
+            self.categories[name] = (category or Category.objects.create(name=name)).pk
+        return self.categories[name]
+
+    def write(self, chunk):
+        now = timezone.now()
+        with transaction.atomic():
+            existing = {sku: (pk, category_id, current_stock) for sku, pk, category_id, current_stock in
+                        Product.objects.filter(sku__in=list(chunk)).values_list(
+                            'sku', 'id', 'category_id', 'current_stock')}
+            to_create, to_update, counts = [], [], {}
+            for sku, row in chunk.items():
+                fields = {name: value for name, value in row.items() if name != 'category'}
+                fields['category_id'] = self.category_id(row['category'])
+                if sku in existing:
+                    fields.pop('initial_stock', None)
+                    to_update.append(Product(pk=existing[sku][0], updated=now, **fields))
+                    counts[sku] = fields['current_stock'] - existing[sku][2]
+                else:
+                    fields.setdefault('initial_stock', fields['current_stock'])
+                    to_create.append(Product(**fields))
+                    counts[sku] = fields['current_stock'] - fields['initial_stock']
+
+            Product.objects.bulk_create(to_create)
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+            ids = dict(Product.objects.filter(sku__in=list(chunk)).values_list('sku', 'id'))
+            record_adjustments({ids[sku]: delta for sku, delta in counts.items()})
+            category_ids = {product.category_id for product in to_create + to_update}
+            category_ids |= {category_id for _, category_id, _ in existing.values()}
+            products_changed(list(ids.values()), category_ids)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.stock import compact_stock
+
+
+class Command(BaseCommand):
+    help = "Fold the pending stock ledger movements into the products' current_stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help="Keep compacting instead of exiting.")
+        parser.add_argument('--interval', type=float, default=1, help="Seconds between compactions with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            compacted = compact_stock(options['batch_size'])
+            if compacted or not options['loop']:
+                self.stdout.write(f"Compacted {compacted} stock movements.")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
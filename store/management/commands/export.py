@@ -0,0 +1,41 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.export import CHUNK_SIZE, EXPORT_FORMATS, EXPORTS, export_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream the catalog or the completed carts as NDJSON or CSV, optionally gzip compressed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', default='-', help="File to write, or - for the standard output.")
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = export_chunks(options['export'], options['format'], options['chunk_size'])
+        path = options['output']
+        if path == '-' and not options['gzip']:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode('utf-8'), ending='')
+            return
+
+        started, size = time.monotonic(), 0
+        stream = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            output = gzip.GzipFile(fileobj=stream, mode='wb') if options['gzip'] else stream
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+            if output is not stream:
+                output.close()
+        finally:
+            if path != '-':
+                stream.close()
+        if path != '-':
+            self.stdout.write(f"Exported {size} bytes to {path} in {time.monotonic() - started:.2f}s.")
@@ -0,0 +1,44 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import FORMATS, READERS, CatalogImporter, guess_format
+
+
+class Command(BaseCommand):
+    help = ("Import products from a JSON array, NDJSON or CSV file, creating or updating them by SKU. "
+            "The file is streamed, so its size does not bound the memory used.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - to read from the standard input.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-errors', type=int, default=20, help="Invalid rows listed in the report.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (None if path == '-' else guess_format(path))
+        if file_format is None:
+            raise CommandError("Cannot guess the file format, use --format.")
+
+        importer = CatalogImporter(batch_size=options['batch_size'], max_errors=options['max_errors'])
+        progress = self.progress if options['verbosity'] > 1 else None
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            importer.run(READERS[file_format](stream), progress)
+        except (ValueError, csv.Error) as error:
+            raise CommandError(f"Import stopped after {importer.rows} rows: {error}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for number, message in importer.errors:
+            self.stderr.write(f"Row {number}: {message}")
+        self.stdout.write(
+            f"Imported {importer.rows} rows in {importer.elapsed:.2f}s ({importer.rate:.0f} rows/s): "
+            f"{importer.created} created, {importer.updated} updated, {importer.invalid} invalid."
+        )
+
+    def progress(self, importer):
+        self.stdout.write(f"{importer.rows} rows ({importer.rate:.0f} rows/s)")
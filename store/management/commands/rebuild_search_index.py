@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of the products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        indexed = rebuild_index(options['batch_size'])
+        self.stdout.write(f"Indexed {indexed} products in {time.monotonic() - started:.2f}s.")
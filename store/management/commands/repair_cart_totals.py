@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Check the stored cart totals against the cart items and repair the carts that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted carts without fixing them.")
+
+    def handle(self, *args, **options):
+        checked = repaired = 0
+        last_pk = None
+        while True:
+            with transaction.atomic():
+                carts = Cart.objects.with_totals().only('id', 'item_count', 'total_amount').order_by('pk')
+                if last_pk is not None:
+                    carts = carts.filter(pk__gt=last_pk)
+                batch = list(carts[:options['batch_size']])
+                if not batch:
+                    break
+
+                drifted = []
+                for cart in batch:
+                    item_count, total_amount = cart.items_count or 0, cart.items_total or 0
+                    if cart.item_count != item_count or abs(cart.total_amount - total_amount) > 1e-6:
+                        cart.item_count, cart.total_amount = item_count, total_amount
+                        drifted.append(cart)
+                if drifted and not options['dry_run']:
+                    Cart.objects.bulk_update(drifted, ['item_count', 'total_amount'])
+
+            checked += len(batch)
+            repaired += len(drifted)
+            last_pk = batch[-1].pk
+
+        action = "drifted" if options['dry_run'] else "repaired"
+        self.stdout.write(f"Checked {checked} carts, {repaired} {action}.")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Send the queued emails in batches over one mail connection, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox instead of exiting.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = drain(options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(f"Sent {sent} emails, {failed} failed.")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from store.stock import set_stock_shards
+
+
+class Command(BaseCommand):
+    help = "Split a hot product's stock across SHARDS counters, or put it back in one with 0."
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('shards', type=int)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 64:
+            raise CommandError("SHARDS must be between 0 and 64.")
+        try:
+            set_stock_shards(options['product_id'], options['shards'])
+        except ValidationError as error:
+            raise CommandError(error.detail[0])
+        self.stdout.write(f"Product {options['product_id']} has {options['shards']} stock shards.")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.sweeper import sweep
+
+
+class Command(BaseCommand):
+    help = "Delete the carts left open for longer than CART_TTL_SECONDS and give their stock back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping instead of exiting.")
+        parser.add_argument('--interval', type=float, default=60, help="Seconds between sweeps with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            swept = sweep(options['batch_size'])
+            if swept or not options['loop']:
+                self.stdout.write(f"Swept {swept} expired carts.")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds of the histogram buckets; +Inf is implicit.
+HISTOGRAMS = {
+    'http_request_duration_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'http_response_size_bytes': (100, 1000, 10000, 100000, 1000000, 10000000),
+    'db_queries_per_request': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+}
+HELP = {
+    'http_requests_total': ('counter', "Requests answered, by route, method and status code."),
+    'http_request_duration_seconds': ('histogram', "Time to answer a request, streaming included."),
+    'http_response_size_bytes': ('histogram', "Size of the response body."),
+    'db_queries_per_request': ('histogram', "SQL queries run by one request."),
+    'db_query_duration_seconds_total': ('counter', "Time spent in SQL queries."),
+}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNRESOLVED = '<unresolved>'
+
+
+class Metrics:
+    """
+    Counters and histograms aggregated in memory under one lock. With METRICS_DIR set, each
+    process also writes its totals to <pid>.json there every METRICS_FLUSH_SECONDS, and
+    render() adds up the files of every worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            # (name, labels) -> [count per bucket and +Inf, sum]
+            self.histograms = {}
+            self.flushed = time.monotonic()
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        buckets = HISTOGRAMS[name]
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(buckets) + 2)
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    def record(self, route, method, status, seconds, size, queries, query_seconds):
+        labels = (('route', route), ('method', method))
+        with self._lock:
+            self.inc('http_requests_total', labels + (('status', str(status)),))
+            self.observe('http_request_duration_seconds', labels, seconds)
+            self.observe('http_response_size_bytes', labels, size)
+            self.observe('db_queries_per_request', labels, queries)
+            self.inc('db_query_duration_seconds_total', labels, query_seconds)
+            due = time.monotonic() - self.flushed >= settings.METRICS_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self):
+        with self._lock:
+            self.flushed = time.monotonic()
+        if not settings.METRICS_DIR:
+            return
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as output:
+            json.dump(self.snapshot(), output)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        """Totals of this process and, with METRICS_DIR, of the files of the other processes."""
+        snapshots = [self.snapshot()]
+        if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+            own = f'{os.getpid()}.json'
+            for name in os.listdir(settings.METRICS_DIR):
+                if name.endswith('.json') and name != own:
+                    try:
+                        with open(os.path.join(settings.METRICS_DIR, name)) as source:
+                            snapshots.append(json.load(source))
+                    except (OSError, ValueError):
+                        continue
+
+        counters, histograms = {}, {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(values))
+                histograms[key] = [a + b for a, b in zip(total, values)]
+        return counters, histograms
+
+    def render(self):
+        """Prometheus text exposition format."""
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, description) in HELP.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+                continue
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(HISTOGRAMS[name] + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_value(values[-1])}')
+                lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
+
+# QueryTimer of the request being served. Context variables follow the request into the
+# threads that run its sync code under ASGI, so every query is counted where it runs.
+query_timer = ContextVar('query_timer', default=None)
+
+
+class QueryTimer:
+    """Counts the SQL queries of a request and the time spent running them."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def time_query(execute, sql, params, many, context):
+    timer = query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.queries += 1
+        timer.seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, response size, status and SQL queries of every request under its
+    resolved route name. Streaming responses are recorded once their body is consumed.
+    Works in sync (WSGI) and async (ASGI) middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance as a coroutine function, as Django's MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer, started = QueryTimer(), time.perf_counter()
+        token = query_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            query_timer.reset(token)
+        return self.record(request, response, timer, started)
+
+    async def __acall__(self, request):
+        timer, started = QueryTimer(), time.perf_counter()
+        token = query_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_timer.reset(token)
+        return self.record(request, response, timer, started)
+
+    def record(self, request, response, timer, started):
+        match = request.resolver_match
+        route = match.view_name if match is not None else UNRESOLVED
+
+        def record(size):
+            metrics.record(route, request.method, response.status_code, time.perf_counter() - started,
+                           size, timer.queries, timer.seconds)
+
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, timer, record)
+        else:
+            record(len(response.content))
+        return response
+
+    @staticmethod
+    def stream(content, timer, record):
+        size = 0
+        token = query_timer.set(timer)
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            query_timer.reset(token)
+            record(size)
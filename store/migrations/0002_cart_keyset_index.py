@@ -0,0 +1,17 @@
+# Generated by Django 3.2.23 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['created', 'id'], name='cart_created_id_idx'),
+        ),
+    ]
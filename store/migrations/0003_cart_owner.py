@@ -0,0 +1,43 @@
+# Generated by Django 3.2.23 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+def backfill_owner(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    Customer = apps.get_model('store', 'Customer')
+
+    # A cart shared by several customers goes to the first of them; carts without
+    # a customer get an owner of their own so they never clash with each other.
+    owners = dict(Customer.objects.filter(cart__isnull=False).order_by('-id').values_list('cart_id', 'id'))
+    carts = []
+    for cart in Cart.objects.only('id').iterator():
+        customer_id = owners.get(cart.id)
+        cart.owner = f"customer:{customer_id}" if customer_id else f"cart:{cart.id.hex}"
+        carts.append(cart)
+    Cart.objects.bulk_update(carts, ['owner'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_cart_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='owner',
+            field=models.CharField(max_length=64, null=True, verbose_name='Owner'),
+        ),
+        migrations.RunPython(backfill_owner, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cart',
+            name='owner',
+            field=models.CharField(max_length=64, verbose_name='Owner'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('completed', False)), fields=('owner',), name='cart_one_active_per_owner'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.23 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+def backfill_totals(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    carts = [
+        cart for cart in Cart.objects.annotate(
+            items_count=models.Sum('item__quantity'),
+            items_total=models.Sum(models.F('item__quantity') * models.F('item__product__price')),
+        ) if cart.items_count
+    ]
+    for cart in carts:
+        cart.item_count = cart.items_count
+        cart.total_amount = cart.items_total or 0
+    Cart.objects.bulk_update(carts, ['item_count', 'total_amount'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_cart_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Item count'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_amount',
+            field=models.FloatField(default=0, editable=False, verbose_name='Total amount'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
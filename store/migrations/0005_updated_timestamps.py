@@ -0,0 +1,23 @@
+# Generated by Django 3.2.23 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_cart_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Last update'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.23 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_updated_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['inclusion_date', 'id'], name='product_inclusion_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['main_colour', 'category'], name='product_colour_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand', 'category'], name='product_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['size', 'sizing', 'fabric'], name='product_size_idx'),
+        ),
+    ]
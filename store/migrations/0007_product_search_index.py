@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is an SQLite feature; other databases fall back to icontains in store.search.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE store_product_fts USING fts5("
+        "description, brand, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO store_product_fts(rowid, description, brand) SELECT id, description, brand FROM store_product"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE store_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
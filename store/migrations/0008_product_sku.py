@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='SKU'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.23 on 2026-10-18 12:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_email', models.EmailField(max_length=200)),
+                ('to', models.EmailField(max_length=200)),
+                ('subject', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sent', models.DateTimeField(blank=True, null=True)),
+                ('cart', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='summary_email', to='store.cart')),
+            ],
+            options={
+                'verbose_name': 'outbox email',
+                'verbose_name_plural': 'outbox emails',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt'], name='outbox_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.23 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_outbox_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['completed', 'created'], name='cart_completed_created_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.23 on 2026-10-18 12:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_ledger(apps, schema_editor):
+    # The ledger opens at initial_stock; what the stock moved since then is one adjustment.
+    Product = apps.get_model('store', 'Product')
+    StockMovement = apps.get_model('store', 'StockMovement')
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=pk, kind='adjust', quantity=current_stock - initial_stock, compacted=True)
+        for pk, initial_stock, current_stock in Product.objects.exclude(
+            current_stock=models.F('initial_stock')).values_list('pk', 'initial_stock', 'current_stock').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_cart_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('reserve', 'Reserve'), ('release', 'Release'), ('sell', 'Sell'), ('restock', 'Restock'), ('adjust', 'Adjust')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('cart_ref', models.UUIDField(blank=True, db_index=True, null=True, verbose_name='Cart')),
+                ('item_ref', models.BigIntegerField(blank=True, null=True, verbose_name='Cart item')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('compacted', models.BooleanField(default=False)),
+                ('product', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_movements', to='store.product')),
+            ],
+            options={
+                'verbose_name': 'stock movement',
+                'verbose_name_plural': 'stock movements',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(condition=models.Q(('compacted', False)), fields=['product', 'quantity'], name='stock_movement_pending_idx'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.23 on 2026-10-18 12:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Stock shards'),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('stock', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='store.product')),
+            ],
+            options={
+                'verbose_name': 'stock shard',
+                'verbose_name_plural': 'stock shards',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockshard',
+            constraint=models.UniqueConstraint(fields=('product', 'shard'), name='stock_shard_unique'),
+        ),
+    ]
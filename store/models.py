@@ -1,8 +1,11 @@
 import uuid
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
 from .constants import COLOURS, SIZE, SIZING, FABRIC, CATEGORIES_CHOICES
+from .sqlite import immediate
 
 
 class Category(models.Model):
@@ -18,8 +21,40 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_ledger_stock(self):
+        """Annotates `ledger_stock`: the current_stock snapshot plus the ledger movements not compacted yet."""
+        return self.annotate(ledger_stock=ledger_stock())
+
+    def with_stock(self):
+        """Annotates `stock`, the available stock: the sum of the shards of a hot product, else its ledger stock."""
+        if 'stock' in self.query.annotations:
+            return self
+        shards = StockShard.objects.filter(product=models.OuterRef('pk')).order_by().values('product').annotate(
+            total=models.Sum('stock')).values('total')
+        return self.annotate(stock=models.Case(
+            models.When(stock_shards__gt=0, then=Coalesce(models.Subquery(shards), 0)),
+            default=ledger_stock(),
+            output_field=models.IntegerField(),
+        ))
+
+    def with_stock_moved(self):
+        """Annotates `stock_moved`, when the latest movement not compacted yet was recorded (None without any)."""
+        latest = StockMovement.objects.filter(product=models.OuterRef('pk'), compacted=False).order_by('-pk').values(
+            'created')[:1]
+        return self.annotate(stock_moved=models.Subquery(latest))
+
+
+
+def ledger_stock():
+    pending = StockMovement.objects.filter(product=models.OuterRef('pk'), compacted=False).order_by().values(
+        'product').annotate(total=models.Sum('quantity')).values('total')
+    return models.F('current_stock') + Coalesce(models.Subquery(pending, output_field=models.IntegerField()), 0)
+
+
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, null=False, blank=False, related_name='products')
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name='SKU')
     main_colour = models.CharField(max_length=50, choices=COLOURS, null=False, blank=False, verbose_name='Main colour')
     second_colour = models.CharField(max_length=50, choices=COLOURS, null=False, blank=False,
                                      verbose_name='Secondary colour')
@@ -32,39 +67,139 @@ class Product(models.Model):
     initial_stock = models.IntegerField(null=False, blank=False, default=10, editable=False,
                                         verbose_name='Initial Stock')
     current_stock = models.IntegerField(null=False, blank=False, verbose_name='Current Stock')
+    # Hot-product mode: with N > 0 the available stock is split across N StockShard counters.
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Stock shards')
     description = models.TextField(max_length=500, null=False, blank=False, verbose_name='Description')
     size = models.CharField(max_length=200, choices=SIZE, null=True, blank=True, verbose_name='Size')
     sizing = models.CharField(max_length=200, choices=SIZING, null=True, blank=True, verbose_name='Sizing')
     fabric = models.CharField(max_length=50, choices=FABRIC, null=True, blank=True, verbose_name='Fabric')
     sleeve = models.BooleanField(default=True, null=True, blank=True, verbose_name='Sleeve')
+    updated = models.DateTimeField(auto_now=True, verbose_name='Last update')
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = "product"
         verbose_name_plural = "products"
+        # Storefront filters and sort orders of the product endpoint. Each sort index ends
+        # with the id, which is the tie breaker of the keyset pagination.
+        indexes = [
+            models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['inclusion_date', 'id'], name='product_inclusion_date_idx'),
+            models.Index(fields=['main_colour', 'category'], name='product_colour_idx'),
+            models.Index(fields=['brand', 'category'], name='product_brand_idx'),
+            models.Index(fields=['size', 'sizing', 'fabric'], name='product_size_idx'),
+        ]
 
     def __str__(self):
         return f"{self.category} | {self.description} | {self.brand}"
 
     @property
     def is_available(self):
-        return self.current_stock > 0
+        # The `stock` of with_stock() when it was loaded, the snapshot otherwise.
+        stock = getattr(self, 'stock', None)
+        return (self.current_stock if stock is None else stock) > 0
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        product._loaded_stock = product.__dict__.get('current_stock')
+        return product
+
+    # current_stock is the snapshot the compact_stock job folds the ledger into, so saving a
+    # loaded product writes it back only when it was changed, as a stock count.
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and self.__dict__.get('current_stock') == getattr(self, '_loaded_stock', None)):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'current_stock']
+        return super(Product, self).save(*args, **kwargs)
+
+
+class CartQuerySet(models.QuerySet):
+    # Aggregates computed from the cart items, used to check the stored totals.
+    def with_totals(self):
+        return self.annotate(
+            items_count=models.Sum('item__quantity'),
+            items_total=models.Sum(models.F('item__quantity') * models.F('item__product__price')),
+        )
+
+    def with_products_updated(self):
+        """Annotates `products_updated`, the latest update of the products in the cart."""
+        latest = CartItem.objects.filter(cart=models.OuterRef('pk')).order_by().values('cart').annotate(
+            latest=models.Max('product__updated')).values('latest')
+        return self.annotate(products_updated=models.Subquery(latest))
+
+    def add_to_totals(self, cart_id, count, amount):
+        if count or amount:
+            self.filter(pk=cart_id).update(
+                item_count=models.F('item_count') + count,
+                total_amount=models.F('total_amount') + amount,
+                updated=timezone.now(),
+            )
 
 
 class Cart(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True)
+    # "customer:<id>" or "session:<key>" of whoever is shopping with this cart.
+    owner = models.CharField(max_length=64, null=False, blank=False, verbose_name='Owner')
     created = models.DateTimeField(auto_now_add=True)
     completed = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+    # Kept up to date by CartItem.save and CartItem.delete, see repair_cart_totals.
+    item_count = models.IntegerField(default=0, editable=False, verbose_name='Item count')
+    total_amount = models.FloatField(default=0, editable=False, verbose_name='Total amount')
+
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order of the carts endpoint.
+            models.Index(fields=['created', 'id'], name='cart_created_id_idx'),
+            # Expired open carts, see store.sweeper.
+            models.Index(fields=['completed', 'created'], name='cart_completed_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['owner'], condition=models.Q(completed=False),
+                                    name='cart_one_active_per_owner'),
+        ]
 
     def __str__(self):
         return str(self.id)
 
-    # We overwrite this method to check that there is no active cart
-    # in order to create another one.
+    @staticmethod
+    def customer_owner(customer_id):
+        return f"customer:{customer_id}"
+
+    @staticmethod
+    def session_owner(session_key):
+        return f"session:{session_key}"
+
+    # We overwrite this method to check that the owner has no other active cart
+    # in order to create another one. The lookup is served by the partial unique index.
+    # The totals are only moved by the F() updates of add_to_totals, so saving a loaded cart
+    # does not write back the ones it was loaded with.
     def save(self, *args, **kwargs):
-        current_cart = Cart.objects.all().first()
-        if not current_cart or current_cart.completed or self.id == current_cart.id:
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.attname not in deferred
+                                       and field.name not in ('item_count', 'total_amount')]
+        with immediate():
+            if not self.completed and Cart.objects.filter(owner=self.owner, completed=False).exclude(
+                    pk=self.pk).exists():
+                raise ValidationError("One cart still in progress")
             return super(Cart, self).save(*args, **kwargs)
-        raise ValidationError("One cart still in progress")
+
+    # The cascade deletes the items without CartItem.delete, so an open cart gives their stock back first.
+    def delete(self, *args, **kwargs):
+        from .stock import release_carts
+
+        with immediate():
+            if not self.completed:
+                release_carts([self.pk])
+            return super(Cart, self).delete(*args, **kwargs)
 
 
 class CartItem(models.Model):
@@ -75,20 +210,110 @@ class CartItem(models.Model):
     def __str__(self):
         return self.product.description
 
+    # Stock is reserved through the stock service when an item is added or its quantity grows,
+    # and given back when the quantity shrinks or the item is removed from an open cart.
+    # The cart totals are moved by the same difference.
     def save(self, *args, **kwargs):
+        from .stock import reserve_stock, release_stock
+
         if self.cart.completed:
             raise ValidationError("This cart is now closed, no more products can be added.")
-        current_product = Product.objects.filter(id=self.product.id).first()
-        if current_product.is_available:
-            if current_product.current_stock < self.quantity:
-                raise ValidationError("The requested quantity does not exist,"
-                                      f" there are {current_product.current_stock} of this product.")
-            current_product.current_stock -= self.quantity
-            #super(Product, current_product).save(*args, **kwargs)
-            return super(CartItem, self).save(*args, **kwargs)
-        else:
-            raise ValidationError("Product not available")
+        with immediate():
+            previous_cart, previous_product, previous_quantity, previous_price = self.cart_id, self.product_id, 0, 0
+            if not self._state.adding:
+                previous = CartItem.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'cart_id', 'product_id', 'quantity', 'product__price').first()
+                if previous:
+                    previous_cart, previous_product, previous_quantity, previous_price = previous
+            # Saved first, so the ledger movements can refer to the item.
+            result = super(CartItem, self).save(*args, **kwargs)
+            if previous_product != self.product_id:
+                release_stock(previous_product, previous_quantity, previous_cart, self.pk)
+                reserve_stock(self.product_id, self.quantity, self.cart_id, self.pk)
+            elif self.quantity >= previous_quantity:
+                reserve_stock(self.product_id, self.quantity - previous_quantity, self.cart_id, self.pk)
+            else:
+                release_stock(self.product_id, previous_quantity - self.quantity, self.cart_id, self.pk)
+
+            amount = self.quantity * self.product.price
+            if previous_cart != self.cart_id:
+                Cart.objects.add_to_totals(previous_cart, -previous_quantity, -previous_quantity * previous_price)
+                previous_quantity, previous_price = 0, 0
+            Cart.objects.add_to_totals(self.cart_id, self.quantity - previous_quantity,
+                                       amount - previous_quantity * previous_price)
+            return result
+
+    def delete(self, *args, **kwargs):
+        from .stock import release_stock
+
+        with immediate():
+            if not self.cart.completed:
+                release_stock(self.product_id, self.quantity, self.cart_id, self.pk)
+            Cart.objects.add_to_totals(self.cart_id, -self.quantity, -self.quantity * self.product.price)
+            return super(CartItem, self).delete(*args, **kwargs)
+
+
+class StockMovement(models.Model):
+    """
+    Append-only inventory ledger. `quantity` is the change of the available stock, and a
+    product's stock is its initial_stock (the opening balance) plus all its movements.
+    """
+    RESERVE = 'reserve'
+    RELEASE = 'release'
+    SELL = 'sell'
+    RESTOCK = 'restock'
+    ADJUST = 'adjust'
+    KINDS = (
+        (RESERVE, 'Reserve'),
+        (RELEASE, 'Release'),
+        (SELL, 'Sell'),
+        (RESTOCK, 'Restock'),
+        (ADJUST, 'Adjust'),
+    )
 
+    # No constraint nor cascade: the ledger outlives the products, the carts and their items,
+    # and the only index on the product is the one of the pending movements.
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                related_name='stock_movements')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    quantity = models.IntegerField()
+    cart_ref = models.UUIDField(null=True, blank=True, db_index=True, verbose_name='Cart')
+    item_ref = models.BigIntegerField(null=True, blank=True, verbose_name='Cart item')
+    created = models.DateTimeField(default=timezone.now)
+    # Folded into Product.current_stock by the compact_stock command.
+    compacted = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = "stock movement"
+        verbose_name_plural = "stock movements"
+        indexes = [
+            # Pending deltas of a product, read without touching the table.
+            models.Index(fields=['product', 'quantity'], condition=models.Q(compacted=False),
+                         name='stock_movement_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity} | {self.product_id}"
+
+
+class StockShard(models.Model):
+    """
+    One of the counters a hot product's available stock is split across, so that concurrent
+    reservations update different rows. See store.stock.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "stock shard"
+        verbose_name_plural = "stock shards"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='stock_shard_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} #{self.shard}: {self.stock}"
 
 
 class Customer(models.Model):
@@ -102,4 +327,36 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.name} {self.surname}"
 
-    # TODO Implement send_mail
+
+class OutboxEmail(models.Model):
+    """Email queued in the transaction that causes it, and delivered later by the send_outbox command."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    cart = models.OneToOneField(Cart, on_delete=models.SET_NULL, null=True, blank=True, related_name='summary_email')
+    from_email = models.EmailField(max_length=200)
+    to = models.EmailField(max_length=200)
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "outbox email"
+        verbose_name_plural = "outbox emails"
+        indexes = [
+            models.Index(fields=['next_attempt'], condition=models.Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} | {self.to} | {self.status}"
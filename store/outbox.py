@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+def due_emails(now):
+    return OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt__lte=now).order_by('next_attempt', 'pk')
+
+
+def claim(batch_size, now):
+    """
+    Takes a batch of due emails by pushing their next attempt one lease ahead, so other
+    workers skip them and a crashed worker's batch becomes due again once the lease ends.
+    """
+    with transaction.atomic():
+        emails = list(due_emails(now).select_for_update(skip_locked=True)[:batch_size])
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            attempts=F('attempts') + 1,
+            next_attempt=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+        )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def backoff(attempts):
+    seconds = settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_MAX_BACKOFF_SECONDS))
+
+
+def deliver(emails, connection):
+    """Sends a claimed batch over an open connection and records the outcome of each email."""
+    failures = {}
+    for email in emails:
+        message = EmailMessage(email.subject, email.body, email.from_email, [email.to], connection=connection)
+        try:
+            if not connection.send_messages([message]):
+                raise RuntimeError("The message was not sent.")
+        except Exception as error:
+            failures[email.pk] = error
+            # The connection may be broken, so the next emails get a new one.
+            connection.close()
+            try:
+                connection.open()
+            except Exception:
+                pass
+
+    now = timezone.now()
+    sent = [email.pk for email in emails if email.pk not in failures]
+    OutboxEmail.objects.filter(pk__in=sent).update(status=OutboxEmail.SENT, sent=now, last_error='')
+    failed = [email for email in emails if email.pk in failures]
+    for email in failed:
+        email.last_error = f"{type(failures[email.pk]).__name__}: {failures[email.pk]}"
+        if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            email.status = OutboxEmail.FAILED
+        else:
+            email.next_attempt = now + backoff(email.attempts)
+    OutboxEmail.objects.bulk_update(failed, ['status', 'next_attempt', 'last_error'])
+    return len(sent), len(failed)
+
+
+def drain(batch_size=100, connection=None):
+    """Delivers every due email batch by batch over one connection. Returns (sent, failed)."""
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    emails = claim(batch_size, timezone.now())
+    if not emails:
+        return sent, failed
+    try:
+        connection.open()
+    except Exception:
+        # send_messages() opens it again per email, and the failures are recorded there.
+        pass
+    try:
+        while emails:
+            batch_sent, batch_failed = deliver(emails, connection)
+            sent, failed = sent + batch_sent, failed + batch_failed
+            emails = claim(batch_size, timezone.now())
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,141 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite key declared by the view as `keyset_ordering`,
+    e.g. ('category_id', 'id'). Pages are fetched with a seek condition on the key and
+    LIMIT page_size + 1, so every page costs the same and no COUNT(*) or OFFSET is issued.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    default_ordering = ('pk',)
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+        self.max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', self.page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_results(list(self.page_queryset(queryset, request, view)))
+
+    def page_queryset(self, queryset, request, view=None):
+        """The query of the requested page; paginate_results() takes its rows."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        ordering = [self._flip(field) for field in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = self.seek(queryset, ordering, self.position)
+        return queryset[:self.page_size + 1]
+
+    def paginate_results(self, results):
+        position, reverse = self.position, self.reverse
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else has_more
+        self.first_position = self.get_position(results[0]) if results else position
+        self.last_position = self.get_position(results[-1]) if results else position
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering(request))
+        return tuple(getattr(view, 'keyset_ordering', self.default_ordering))
+
+    def get_position(self, item):
+        return [self._encode_value(getattr(item, field.lstrip('-'))) for field in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    @staticmethod
+    def seek(queryset, ordering, position):
+        # (a, b) > (x, y) is written as a >= x AND (a > x OR (a = x AND b > y)), so the
+        # leading column gives the database an index range to start from.
+        condition, equal = Q(), {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition |= Q(**equal, **{name + lookup: value})
+            equal[name] = value
+        first, value = ordering[0], position[0]
+        bound = ordering[0].lstrip('-') + ('__lte' if first.startswith('-') else '__gte')
+        return queryset.filter(Q(**{bound: value}) & condition)
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _encode_value(value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        return str(value)
@@ -0,0 +1,79 @@
+import decimal
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:
+    ormsgpack = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+drf_default = JSONEncoder().default
+
+
+def encode_default(value):
+    """
+    Converts the types the encoders do not know natively as DRF's JSONEncoder does, so every
+    renderer produces the same values. Decimals (DecimalField with COERCE_DECIMAL_TO_STRING
+    off) become floats, the others (lazy strings, querysets...) go to DRF's encoder.
+    """
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return drf_default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson, which encodes dicts, lists, UUIDs and datetimes natively and
+    produces the same bytes as DRF's compact UTF-8 JSON. It falls back to DRF's renderer
+    when orjson is not installed, for indented output and for values orjson refuses.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        try:
+            return orjson.dumps(data, default=encode_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack for internal clients (Accept: application/msgpack or ?format=msgpack).
+    UUIDs and datetimes become the same strings as in JSON. Uses ormsgpack, which knows
+    them natively, or msgpack; without either it is not offered.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = ormsgpack is not None or msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if ormsgpack is not None:
+            return ormsgpack.packb(data, default=encode_default,
+                                   option=ormsgpack.OPT_UTC_Z | ormsgpack.OPT_NON_STR_KEYS)
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    # Renderers whose optional library is missing are left out of the negotiation.
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [renderer for renderer in renderers if getattr(renderer, 'available', True)]
+        return super().select_renderer(request, renderers, format_suffix)
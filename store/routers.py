@@ -0,0 +1,109 @@
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# Models whose reads may be served by a replica, when the view allows it.
+REPLICA_MODELS = ('store.Category', 'store.Product')
+PIN_COOKIE = 'primary_pin'
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_state = ContextVar('database_routing', default=None)
+
+
+@contextmanager
+def routing(pinned=False):
+    """Routing state of one request: replica reads stay off until read_from_replicas()."""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def read_from_replicas():
+    state = _state.get()
+    if state is not None and not state.pinned and settings.DATABASE_REPLICAS:
+        # One replica per request, so that all its reads see the same point in time.
+        state.replica = state.replica or random.choice(settings.DATABASE_REPLICAS)
+
+
+def reading_from_replica():
+    state = _state.get()
+    return state is not None and state.replica is not None and not state.pinned
+
+
+class ReplicaRouter:
+    """
+    Sends the catalog reads of the requests that opted in with read_from_replicas() to one of
+    settings.DATABASE_REPLICAS, and everything else to the primary. The first write pins the
+    rest of the request to the primary, so it reads what it has just written.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label in REPLICA_MODELS and reading_from_replica():
+            return _state.get().replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Opens the routing state of each request. Unsafe requests and clients that wrote in the last
+    DATABASE_REPLICA_LAG_SECONDS (a cookie) are pinned to the primary for the whole request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        with routing(self.pinned(request)) as state:
+            response = self.get_response(request)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        with routing(self.pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.pin(request, response, state)
+
+    @staticmethod
+    def pinned(request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    @staticmethod
+    def pin(request, response, state):
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_LAG_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,81 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Product
+
+FTS_TABLE = 'store_product_fts'
+PRODUCT_TABLE = Product._meta.db_table
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def index_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids or not search_enabled():
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, description, brand) "
+            f"SELECT id, description, brand FROM {PRODUCT_TABLE} WHERE id IN ({placeholders})",
+            product_ids,
+        )
+
+
+def remove_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids or not search_enabled():
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+
+def rebuild_index(batch_size=5000):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        last_id, indexed = 0, 0
+        while True:
+            cursor.execute(f"SELECT MAX(id), COUNT(*) FROM (SELECT id FROM {PRODUCT_TABLE} WHERE id > %s "
+                           "ORDER BY id LIMIT %s)", [last_id, batch_size])
+            max_id, count = cursor.fetchone()
+            if not count:
+                break
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, description, brand) "
+                f"SELECT id, description, brand FROM {PRODUCT_TABLE} WHERE id > %s AND id <= %s",
+                [last_id, max_id],
+            )
+            last_id, indexed = max_id, indexed + count
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def match_expression(query):
+    # Every word must match as the prefix of a word of the description or the brand.
+    tokens = ['"{}"*'.format(token.replace('"', '""')) for token in TOKEN_RE.findall(query)]
+    return ' AND '.join(tokens) or None
+
+
+def search_product_ids(query, limit):
+    """Ids of the products matching query, best ranked first."""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    if not search_enabled():
+        condition = Q()
+        for token in TOKEN_RE.findall(query):
+            condition &= Q(description__icontains=token) | Q(brand__icontains=token)
+        return list(Product.objects.filter(condition).order_by('id').values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
@@ -1,8 +1,15 @@
+from functools import lru_cache
+
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
-from django.db.models import Sum
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 
 from .models import Category, Product, Cart, CartItem, Customer
+from .signals import products_changed
+from .sqlite import immediate
+from .stock import record_adjustments
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -11,13 +18,91 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ProductListSerializer(serializers.ListSerializer):
+    """
+    Writes many products with one bulk query. Each item is validated against its own
+    instance, and `item_results` keeps the (validated data, errors) of every item, so the
+    valid ones can still be written when others fail.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+        instances = self.instance if isinstance(self.instance, list) else [None] * len(data)
+        self.item_results = []
+        for instance, item in zip(instances, data):
+            self.child.instance = instance
+            try:
+                self.item_results.append((self.child.run_validation(item), {}))
+            except serializers.ValidationError as exc:
+                self.item_results.append((None, exc.detail))
+        self.child.instance = None
+
+        errors = [errors for _, errors in self.item_results]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return [attrs for attrs, _ in self.item_results]
+
+    def create(self, validated_data):
+        products = [Product(**attrs) for attrs in validated_data]
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # The transaction holds the write lock, so the rows just inserted are the
+                # last ones, numbered in insertion order.
+                ids = Product.objects.order_by('-pk').values_list('pk', flat=True)[:len(products)]
+                for product, pk in zip(products, list(ids)[::-1]):
+                    product.pk = pk
+            record_adjustments({product.pk: product.current_stock - product.initial_stock for product in products})
+            products_changed([product.pk for product in products], {product.category_id for product in products})
+        return products
+
+    def update(self, instances, validated_data):
+        now = timezone.now()
+        fields, category_ids, counts = {'updated'}, set(), {}
+        for product, attrs in zip(instances, validated_data):
+            category_ids.add(product.category_id)
+            if 'current_stock' in attrs:
+                counts[product.pk] = attrs['current_stock'] - product.current_stock
+            for name, value in attrs.items():
+                setattr(product, name, value)
+            product.updated = now
+            category_ids.add(product.category_id)
+            fields.update(attrs)
+        with transaction.atomic():
+            Product.objects.bulk_update(instances, fields)
+            record_adjustments(counts)
+            products_changed([product.pk for product in instances], category_ids)
+        return instances
+
+
+class StockField(serializers.IntegerField):
+    """
+    current_stock: written as a stock count, read as the available stock `stock` when the
+    queryset annotates it (see Meta.annotations), so that hot products show their shards.
+    """
+    read_source = 'stock'
+
+    def get_attribute(self, instance):
+        stock = getattr(instance, self.read_source, None)
+        return super().get_attribute(instance) if stock is None else stock
+
+
 class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.StringRelatedField(source="category.name")
     product_available = serializers.SerializerMethodField(method_name="is_available")
 
     class Meta:
         model = Product
-        exclude = ['initial_stock']
+        exclude = ['initial_stock', 'updated', 'sku', 'stock_shards']
+        list_serializer_class = ProductListSerializer
+        method_sources = {'product_available': ('stock', 'current_stock')}
+        # Annotation read by the fields -> the queryset method adding it, applied to reads.
+        annotations = {'stock': 'with_stock'}
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super().build_standard_field(field_name, model_field)
+        return StockField if field_name == 'current_stock' else field_class, field_kwargs
 
     @staticmethod
     def is_available(product: Product):
@@ -32,6 +117,9 @@ class CapSerializer(ProductSerializer):
             'sizing',
             'fabric',
             'sleeve',
+            'updated',
+            'sku',
+            'stock_shards',
         ]
 
 
@@ -40,7 +128,9 @@ class TShirtSerializer(ProductSerializer):
         exclude = [
             'logo_colour',
             'initial_stock',
-
+            'updated',
+            'sku',
+            'stock_shards',
         ]
 
 
@@ -62,6 +152,9 @@ class SimpleProductSerializer(ProductSerializer):
             'sizing',
             'fabric',
             'sleeve',
+            'updated',
+            'sku',
+            'stock_shards',
         ]
 
 
@@ -72,6 +165,7 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ["id", "cart", "product", "quantity", "sub_total"]
+        method_sources = {'sub_total': ('quantity', 'product__price')}
 
     def total(self, cart_item: CartItem):
         return cart_item.quantity * cart_item.product.price
@@ -86,33 +180,26 @@ class AddCartItemSerializer(CartItemSerializer):
 
         return value
 
+    # Stock is taken by CartItem.save through the stock reservation service.
     def save(self, **kwargs):
         cart_id = self.context["cart_id"]
         product_id = self.validated_data["product_id"]
         quantity = self.validated_data["quantity"]
-        product = Product.objects.filter(id=product_id)
-        try:
-            if product.is_available:
-                cart_item = CartItem.objects.get(
-                    product_id=product_id,
-                    cart_id=cart_id
-                )
+        with immediate():
+            cart_item = CartItem.objects.select_for_update().filter(
+                product_id=product_id,
+                cart_id=cart_id
+            ).first()
+            if cart_item is not None:
                 cart_item.quantity += quantity
                 cart_item.save()
-
-                self.instance = cart_item
             else:
-                raise ValidationError("This product is out of stock")
-        except:
-            self.instance = CartItem.objects.create(
-                cart_id=cart_id,
-                **self.validated_data
-            )
-        finally:
-            #  Stock update
-            product.current_stock -= quantity
-            product.save()
+                cart_item = CartItem.objects.create(
+                    cart_id=cart_id,
+                    **self.validated_data
+                )
 
+        self.instance = cart_item
         return self.instance
 
     class Meta(CartItemSerializer.Meta):
@@ -126,22 +213,148 @@ class CartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cart
-        fields = ["id", "items", "total", "created", "completed"]
-
-    def main_total(self, cart_item: CartItem):
-        total = CartItem.objects.filter(cart=cart_item.id).select_related('product').values_list(
-            'product__price').aggregate(
-            Sum('product__price'))
-        return total['product__price__sum']
-
-    def cart_items(self, cart_item: CartItem):
-        items = CartItem.objects.filter(cart=cart_item.id).select_related('product').values('product__id',
-                                                                                            'product__description',
-                                                                                            'product__price')
-        return items
+        fields = ["id", "items", "item_count", "total", "created", "completed"]
+        method_sources = {
+            'items': ('item__quantity', 'item__product__id', 'item__product__description', 'item__product__price'),
+            'total': ('total_amount',),
+        }
+
+    def main_total(self, cart: Cart):
+        return cart.total_amount
+
+    def cart_items(self, cart: Cart):
+        if 'item' in getattr(cart, '_prefetched_objects_cache', {}):
+            items = cart.item.all()
+        else:
+            items = cart.item.select_related('product')
+        return [
+            {
+                'product__id': item.product.id,
+                'product__description': item.product.description,
+                'product__price': item.product.price,
+                'quantity': item.quantity,
+                'sub_total': item.quantity * item.product.price,
+            }
+            for item in items
+        ]
 
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = '__all__'
+
+
+class QueryPlan:
+    """
+    How to load a model for a serializer: forward relations to join, to-many relations
+    to prefetch (each with its own plan) and the columns to load with only().
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.select = set()
+        self.prefetch = {}
+        self.only = {model._meta.pk.name}
+        self.annotations = set()
+        self.full = False
+
+    def add_source(self, model, prefix, parts, descend=False):
+        plan = self
+        for index, attr in enumerate(parts):
+            try:
+                field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # Properties and plain attributes may read any column of the model.
+                plan.load_all(model, prefix)
+                return None
+            path = prefix + field.name
+            if not field.is_relation:
+                plan.only.add(path)
+                return None
+            if field.many_to_many or field.one_to_many:
+                plan = plan.prefetch.setdefault(path, QueryPlan(field.related_model))
+                if field.one_to_many:
+                    plan.only.add(field.field.name)
+                prefix = ''
+            else:
+                plan.only.add(path)
+                if index == len(parts) - 1 and not descend:
+                    return None
+                plan.select.add(path)
+                prefix = path + '__'
+            model = field.related_model
+        return plan, model, prefix
+
+    def add_serializer(self, serializer, prefix=''):
+        model = serializer.Meta.model
+        method_sources = getattr(serializer.Meta, 'method_sources', {})
+        annotations = getattr(serializer.Meta, 'annotations', {})
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                for source in method_sources.get(field.field_name, ()):
+                    # Related rows cannot be annotated: the fields fall back to their columns.
+                    if source in annotations:
+                        if not prefix:
+                            self.annotations.add(annotations[source])
+                    else:
+                        self.add_source(model, prefix, source.split('__'))
+                continue
+            if getattr(field, 'read_source', None) in annotations and not prefix:
+                self.annotations.add(annotations[field.read_source])
+            if field.source == '*':
+                continue
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            relation = field.child_relation if isinstance(field, serializers.ManyRelatedField) else field
+            if isinstance(nested, serializers.ModelSerializer):
+                target = self.add_source(model, prefix, field.source_attrs, descend=True)
+                if target is not None:
+                    plan, _, nested_prefix = target
+                    plan.add_serializer(nested, nested_prefix)
+            elif isinstance(relation, serializers.RelatedField) and not relation.use_pk_only_optimization():
+                target = self.add_source(model, prefix, field.source_attrs, descend=True)
+                if target is not None:
+                    plan, related_model, related_prefix = target
+                    plan.load_all(related_model, related_prefix)
+            else:
+                self.add_source(model, prefix, field.source_attrs)
+
+    def load_all(self, model, prefix):
+        if prefix:
+            self.only.update(prefix + field.name for field in model._meta.concrete_fields)
+        else:
+            self.full = True
+
+    def apply(self, queryset, only=True):
+        # Instances that will be saved answer with what they store, so only reads are annotated.
+        if only:
+            for method in sorted(self.annotations):
+                queryset = getattr(queryset, method)()
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        for path, child in sorted(self.prefetch.items()):
+            queryset = queryset.prefetch_related(
+                Prefetch(path, queryset=child.apply(child.model._default_manager.all(), only))
+            )
+        if only and not self.full:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+@lru_cache(maxsize=None)
+def build_query_plan(serializer_class):
+    plan = QueryPlan(serializer_class.Meta.model)
+    plan.add_serializer(serializer_class())
+    return plan
+
+
+def plan_queryset(queryset, serializer_class, only=True):
+    """
+    Apply select_related, prefetch_related and only() to a queryset from the fields declared
+    on serializer_class, so that serializing any number of rows costs a fixed number of queries.
+    SerializerMethodFields declare the model paths they read in Meta.method_sources.
+    Pass only=False for instances that will be saved, as save() skips deferred fields.
+    """
+    return build_query_plan(serializer_class).apply(queryset, only)
@@ -0,0 +1,60 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import catalog_cache
+from .models import Category, Product
+from .search import index_products, remove_products
+from .stock import record_adjustments, remove_from_carts
+
+
+def products_changed(product_ids, category_ids):
+    # What the Product signals do, for bulk writes that do not send them.
+    index_products(product_ids)
+    catalog_cache.bump(category_ids)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, **kwargs):
+    instance._previous_category_id = instance._previous_stock = None
+    if instance.pk is not None:
+        instance._previous_category_id, instance._previous_stock = Product.objects.filter(
+            pk=instance.pk).values_list('category_id', 'current_stock').first() or (None, None)
+
+
+@receiver(post_save, sender=Product)
+def record_stock_count(sender, instance, created, update_fields, **kwargs):
+    # The ledger opens at initial_stock; a stock written to current_stock is an adjustment.
+    if created:
+        record_adjustments({instance.pk: instance.current_stock - instance.initial_stock})
+    elif instance._previous_stock is not None and (update_fields is None or 'current_stock' in update_fields):
+        record_adjustments({instance.pk: instance.current_stock - instance._previous_stock})
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    category_ids = [instance.category_id]
+    if getattr(instance, '_previous_category_id', None) is not None:
+        category_ids.append(instance._previous_category_id)
+    catalog_cache.bump(category_ids)
+
+
+@receiver(pre_delete, sender=Product)
+def remove_product_from_carts(sender, instance, **kwargs):
+    remove_from_carts([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    catalog_cache.bump([instance.pk])
@@ -0,0 +1,25 @@
+"""
+SQLite backend for concurrent writers (ENGINE 'store.sqlite'): applies the PRAGMAS of the
+database settings to every connection and opens the transactions of immediate() with
+BEGIN IMMEDIATE.
+"""
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def immediate(using=None):
+    """
+    transaction.atomic() for the cart and stock writes. On SQLite the outermost transaction
+    takes the write lock when it begins, so a writer waits for busy_timeout instead of
+    failing with "database is locked" when its read would have to become a write.
+    """
+    connection = transaction.get_connection(using)
+    connection.begin_immediate = not connection.in_atomic_block
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        connection.begin_immediate = False
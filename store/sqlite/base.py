@@ -0,0 +1,14 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
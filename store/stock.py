@@ -0,0 +1,296 @@
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.db import connections, router
+from django.db.models import BigIntegerField, Case, DateTimeField, F, FloatField, IntegerField, Q, Subquery, Sum, \
+    UUIDField, Value, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import catalog_cache
+from .models import Cart, CartItem, Product, StockMovement, StockShard
+from .sqlite import immediate
+
+LEDGER_COLUMNS = ('product_id', 'kind', 'quantity', 'cart_ref', 'item_ref', 'created', 'compacted')
+
+# Products delete_products already took out of the carts, skipped by the pre_delete signal.
+_removed_from_carts = ContextVar('removed_from_carts', default=frozenset())
+
+
+def invalidate_stock(product_ids):
+    catalog_cache.bump(Product.objects.filter(pk__in=product_ids).values_list('category_id', flat=True).distinct())
+
+
+def available_stock(product_id):
+    """The available stock of one product (see Product.objects.with_stock), None when it does not exist."""
+    return Product.objects.with_stock().filter(pk=product_id).values_list('stock', flat=True).first()
+
+
+def reserve_stock(product_id, quantity, cart_id=None, item_id=None):
+    # Check and take in one conditional statement, so concurrent buyers can never take more
+    # units than there are: a ledger INSERT ... SELECT that does not write the product row
+    # itself, or else for a hot product an UPDATE of one of its shards.
+    if quantity <= 0:
+        return
+    with immediate():
+        movement = Product.objects.with_ledger_stock().filter(
+            pk=product_id, stock_shards=0, ledger_stock__gte=quantity).values_list(
+            'pk', Value(StockMovement.RESERVE), Value(-quantity), Value(cart_id, output_field=UUIDField()),
+            Value(item_id, output_field=BigIntegerField()), Value(timezone.now(), output_field=DateTimeField()),
+            Value(False))
+        connection = connections[router.db_for_write(StockMovement)]
+        sql, params = movement.query.get_compiler(connection=connection).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {StockMovement._meta.db_table} ({', '.join(LEDGER_COLUMNS)}) {sql}", params)
+            if cursor.rowcount:
+                invalidate_stock([product_id])
+                return
+
+        if take_from_shard(product_id, quantity):
+            record(product_id, StockMovement.RESERVE, -quantity, cart_id, item_id)
+            invalidate_stock([product_id])
+            return
+        shards, current_stock = Product.objects.with_stock().filter(pk=product_id).values_list(
+            'stock_shards', 'stock').first() or (0, None)
+        if shards and take_across_shards(product_id, shards, quantity):
+            record(product_id, StockMovement.RESERVE, -quantity, cart_id, item_id)
+            invalidate_stock([product_id])
+            return
+        if current_stock is None:
+            raise ValidationError("There is no product associated with the given ID")
+        if current_stock <= 0:
+            raise ValidationError("Product not available")
+        raise ValidationError("The requested quantity does not exist,"
+                              f" there are {current_stock} of this product.")
+
+
+def take_from_shard(product_id, quantity):
+    """Takes `quantity` from a random shard of the product that holds it; False when none does."""
+    holding = StockShard.objects.filter(product_id=product_id, stock__gte=quantity).order_by('?').values('pk')[:1]
+    return bool(StockShard.objects.filter(pk=Subquery(holding), stock__gte=quantity).update(
+        stock=F('stock') - quantity))
+
+
+def take_across_shards(product_id, shards, quantity):
+    """
+    For drained shards, none of which holds `quantity`: takes it from their total and spreads
+    the rest over them again. False when even the total falls short.
+    """
+    total = StockShard.objects.filter(product_id=product_id).aggregate(total=Sum('stock'))['total'] or 0
+    if total < quantity:
+        return False
+    rebalance_shards(product_id, shards, total - quantity)
+    return True
+
+
+def rebalance_shards(product_id, shards, total):
+    """Spreads `total` units evenly over the product's shards, in one UPDATE."""
+    share, extra = divmod(total, shards)
+    StockShard.objects.filter(product_id=product_id).update(stock=Case(
+        When(shard__lt=extra, then=Value(share + 1)), default=Value(share), output_field=IntegerField()))
+
+
+def set_stock_shards(product_id, shards):
+    """Turns the hot-product mode on with `shards` counters (or resizes them), or off with 0."""
+    with immediate():
+        stock = Product.objects.with_ledger_stock().filter(pk=product_id).values_list('ledger_stock', flat=True).first()
+        if stock is None:
+            raise ValidationError("There is no product associated with the given ID")
+        Product.objects.filter(pk=product_id).update(stock_shards=shards)
+        StockShard.objects.filter(product_id=product_id).delete()
+        if shards:
+            StockShard.objects.bulk_create([StockShard(product_id=product_id, shard=shard)
+                                            for shard in range(shards)])
+            rebalance_shards(product_id, shards, stock)
+        invalidate_stock([product_id])
+
+
+def add_to_shards(deltas):
+    """Gives units back to the emptiest shard of the hot products among {product id: delta}."""
+    for product_id in Product.objects.filter(pk__in=[pk for pk, delta in deltas.items() if delta],
+                                             stock_shards__gt=0).values_list('pk', flat=True):
+        emptiest = StockShard.objects.filter(product_id=product_id).order_by('stock').values('pk')[:1]
+        StockShard.objects.filter(pk=Subquery(emptiest)).update(stock=F('stock') + deltas[product_id])
+
+
+def record(product_id, kind, quantity, cart_id=None, item_id=None):
+    StockMovement.objects.create(product_id=product_id, kind=kind, quantity=quantity, cart_ref=cart_id,
+                                 item_ref=item_id)
+
+
+def release_stock(product_id, quantity, cart_id=None, item_id=None):
+    if quantity <= 0:
+        return
+    with immediate():
+        record(product_id, StockMovement.RELEASE, quantity, cart_id, item_id)
+        add_to_shards({product_id: quantity})
+        invalidate_stock([product_id])
+
+
+def restock(product_id, quantity):
+    if quantity > 0:
+        with immediate():
+            record(product_id, StockMovement.RESTOCK, quantity)
+            add_to_shards({product_id: quantity})
+            invalidate_stock([product_id])
+
+
+def release_carts(cart_ids):
+    """Gives back the stock held by the items of open carts, with one insert for all of them."""
+    movements = [
+        StockMovement(product_id=product_id, kind=StockMovement.RELEASE, quantity=quantity, cart_ref=cart_id,
+                      item_ref=item_id)
+        for item_id, cart_id, product_id, quantity in CartItem.objects.filter(
+            cart_id__in=cart_ids, product__isnull=False, quantity__gt=0).values_list(
+            'pk', 'cart_id', 'product_id', 'quantity')
+    ]
+    StockMovement.objects.bulk_create(movements)
+    deltas = defaultdict(int)
+    for movement in movements:
+        deltas[movement.product_id] += movement.quantity
+    add_to_shards(deltas)
+    if deltas:
+        invalidate_stock(deltas)
+
+
+def remove_from_carts(product_ids):
+    """
+    Takes the lines of products about to be deleted out of their carts, which the cascade would
+    delete without CartItem.delete: one grouped UPDATE of the cart totals, and one insert for the
+    stock the open carts give back.
+    """
+    product_ids = [pk for pk in product_ids if pk not in _removed_from_carts.get()]
+    if not product_ids:
+        return
+    lines = list(CartItem.objects.filter(product_id__in=product_ids, cart__isnull=False).values_list(
+        'pk', 'cart_id', 'product_id', 'quantity', 'product__price', 'cart__completed'))
+    if not lines:
+        return
+    counts, amounts = defaultdict(int), defaultdict(float)
+    for _, cart_id, _, quantity, price, _ in lines:
+        counts[cart_id] += quantity
+        amounts[cart_id] += quantity * price
+    Cart.objects.filter(pk__in=counts).update(
+        item_count=F('item_count') - Case(*[When(pk=cart_id, then=Value(count)) for cart_id, count in counts.items()],
+                                          output_field=IntegerField()),
+        total_amount=F('total_amount') - Case(
+            *[When(pk=cart_id, then=Value(amount)) for cart_id, amount in amounts.items()],
+            output_field=FloatField()),
+        updated=timezone.now(),
+    )
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, kind=StockMovement.RELEASE, quantity=quantity, cart_ref=cart_id,
+                      item_ref=item_id)
+        for item_id, cart_id, product_id, quantity, _, completed in lines if not completed and quantity > 0
+    ])
+    CartItem.objects.filter(pk__in=[item_id for item_id, *_ in lines]).delete()
+
+
+def delete_products(product_ids):
+    """Deletes products, with their cart lines taken out beforehand for all of them at once."""
+    with immediate():
+        remove_from_carts(product_ids)
+        token = _removed_from_carts.set(frozenset(product_ids))
+        try:
+            return Product.objects.filter(pk__in=product_ids).delete()
+        finally:
+            _removed_from_carts.reset(token)
+
+
+def settle_cart(cart_id):
+    """
+    Sells the lines of a cart being completed. Every line is checked against the stock first:
+    units its reservations fall short of (lines from before the ledger) must still be available.
+    Then the cart's pending movements and the shortfall reach current_stock with one UPDATE ... CASE,
+    and the sale is recorded as compacted release and sell movements: a constant number of queries.
+    """
+    lines = dict(CartItem.objects.filter(cart_id=cart_id, quantity__gt=0).order_by().values('product_id').annotate(
+        units=Sum('quantity')).values_list('product_id', 'units'))
+    if not lines:
+        raise ValidationError("The cart is empty.")
+    if None in lines:
+        raise ValidationError("Some products of the cart no longer exist.")
+    reservations = {product_id: (-total, pending or 0) for product_id, total, pending in StockMovement.objects.filter(
+        cart_ref=cart_id).order_by().values('product_id').annotate(
+        total=Sum('quantity'), pending=Sum('quantity', filter=Q(compacted=False))).values_list(
+        'product_id', 'total', 'pending')}
+
+    shortfall = {product_id: lines.get(product_id, 0) - reservations.get(product_id, (0, 0))[0]
+                 for product_id in lines.keys() | reservations.keys()}
+    errors = [f"The requested quantity of {description} does not exist, there are {max(stock, 0)} of this product."
+              for description, stock, product_id in Product.objects.with_stock().filter(pk__in=lines).values_list(
+                  'description', 'stock', 'pk') if stock < max(shortfall[product_id], 0)]
+    if errors:
+        raise ValidationError(errors)
+
+    # Compacted movements are in current_stock already: the pending ones and the shortfall are not.
+    add_to_stock({product_id: reservations.get(product_id, (0, 0))[1] - short
+                  for product_id, short in shortfall.items()})
+    StockMovement.objects.filter(cart_ref=cart_id, compacted=False).update(compacted=True)
+    movements = []
+    for product_id in shortfall:
+        reserved, units = reservations.get(product_id, (0, 0))[0], lines.get(product_id, 0)
+        if reserved:
+            movements.append(StockMovement(product_id=product_id, kind=StockMovement.RELEASE, quantity=reserved,
+                                           cart_ref=cart_id, compacted=True))
+        if units:
+            movements.append(StockMovement(product_id=product_id, kind=StockMovement.SELL, quantity=-units,
+                                           cart_ref=cart_id, compacted=True))
+    StockMovement.objects.bulk_create(movements)
+    rebalance_hot_products([product_id for product_id, short in shortfall.items() if short])
+
+
+def record_adjustments(deltas):
+    """
+    Records stock counts written straight to current_stock, and opening stocks other than
+    initial_stock, as movements already compacted: the snapshot includes them.
+    """
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, kind=StockMovement.ADJUST, quantity=delta, compacted=True)
+        for product_id, delta in deltas.items() if delta
+    ])
+    rebalance_hot_products([product_id for product_id, delta in deltas.items() if delta])
+
+
+def rebalance_hot_products(product_ids):
+    """Spreads the ledger stock of the hot products among `product_ids` over their shards again."""
+    for product_id, shards, stock in Product.objects.with_ledger_stock().filter(
+            pk__in=product_ids, stock_shards__gt=0).values_list('pk', 'stock_shards', 'ledger_stock'):
+        rebalance_shards(product_id, shards, stock)
+
+
+def add_to_stock(deltas):
+    """Adds {product id: delta} to current_stock with one UPDATE for all the products."""
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if deltas:
+        Product.objects.filter(pk__in=deltas).update(
+            current_stock=F('current_stock') + Case(
+                *[When(pk=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+                output_field=IntegerField(),
+            ),
+            updated=timezone.now(),
+        )
+        invalidate_stock(deltas)
+    return deltas
+
+
+def compact_chunk(batch_size):
+    """Folds the oldest pending movements into the products' snapshots; the number folded."""
+    with immediate():
+        movements = list(StockMovement.objects.filter(compacted=False).order_by('pk').values_list(
+            'pk', 'product_id', 'quantity')[:batch_size])
+        deltas = defaultdict(int)
+        for _, product_id, quantity in movements:
+            deltas[product_id] += quantity
+        add_to_stock(deltas)
+        StockMovement.objects.filter(pk__in=[pk for pk, _, _ in movements]).update(compacted=True)
+    return len(movements)
+
+
+def compact_stock(batch_size=1000):
+    compacted = 0
+    while True:
+        folded = compact_chunk(batch_size)
+        compacted += folded
+        if folded < batch_size:
+            return compacted
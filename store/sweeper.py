@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Cart, Customer
+from .sqlite import immediate
+from .stock import release_carts
+
+
+def expired_carts(now):
+    """
+    Open carts untouched for CART_TTL_SECONDS. A cart is never updated before it is created,
+    so the (completed, created) index narrows the scan and `updated` keeps the carts in use.
+    """
+    cutoff = now - timedelta(seconds=settings.CART_TTL_SECONDS)
+    return Cart.objects.filter(completed=False, created__lt=cutoff, updated__lt=cutoff).order_by('created')
+
+
+def sweep_chunk(batch_size, now):
+    """Deletes one chunk of expired carts and returns their stock; the number of carts deleted."""
+    with immediate():
+        cart_ids = list(expired_carts(now).values_list('pk', flat=True)[:batch_size])
+        if not cart_ids:
+            return 0
+        release_carts(cart_ids)
+        # The customers' details outlive their abandoned carts.
+        Customer.objects.filter(cart_id__in=cart_ids).update(cart=None)
+        Cart.objects.filter(pk__in=cart_ids).delete()
+    return len(cart_ids)
+
+
+def sweep(batch_size, now=None):
+    """Sweeps the carts expired at `now`, chunk by chunk, each in its own short transaction."""
+    now = now or timezone.now()
+    swept = 0
+    while True:
+        deleted = sweep_chunk(batch_size, now)
+        swept += deleted
+        if deleted < batch_size:
+            return swept
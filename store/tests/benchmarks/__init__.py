@@ -0,0 +1,29 @@
+"""
+Benchmarks. They are not collected by the default test run; run them with
+
+    python manage.py test store.tests.benchmarks --pattern="bench_*.py"
+
+BENCH_PRODUCTS sets the size of the synthetic catalog, see data.py.
+"""
+import os
+import statistics
+import time
+
+BENCH_PRODUCTS = int(os.environ.get('BENCH_PRODUCTS', 50000))
+
+
+def timed(function, repeat=5):
+    """Median wall time of function() in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def report(title, header, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    lines = [title, '  '.join(str(value).ljust(width) for value, width in zip(header, widths))]
+    lines += ['  '.join(str(value).ljust(width) for value, width in zip(row, widths)) for row in rows]
+    print('\n' + '\n'.join(lines))
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, TransactionTestCase
+
+from nappstore.asgi import application as asgi_application
+from nappstore.wsgi import application as wsgi_application
+from ...aio import database
+from ...models import Cart, Product
+from . import BENCH_PRODUCTS, report
+from .data import seed_carts, seed_catalog
+
+BENCH_CONCURRENCY = [int(clients) for clients in os.environ.get('BENCH_CONCURRENCY', '1,8,32,128').split(',')]
+# Threads of the WSGI worker process: 1 is a sync worker.
+BENCH_WSGI_THREADS = int(os.environ.get('BENCH_WSGI_THREADS', 1))
+# Latency added to every query, as a database across the network would have.
+BENCH_QUERY_LATENCY_MS = float(os.environ.get('BENCH_QUERY_LATENCY_MS', 5))
+REQUESTS_PER_CLIENT = 10
+WORKER_CALLS = 1000
+WORKER_ALIAS = 'bench_worker'
+
+
+def slow_query(execute, sql, params, many, context):
+    time.sleep(BENCH_QUERY_LATENCY_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+def add_latency(sender, connection, **kwargs):
+    connection.execute_wrappers.append(slow_query)
+
+
+async def asgi_get(path):
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver')], 'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_application(scope, receive, send)
+    return messages[0]['status']
+
+
+def wsgi_get(path):
+    path, _, query = path.partition('?')
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'REQUEST_METHOD': 'GET', 'wsgi.input': BytesIO()}
+    setup_testing_defaults(environ)
+    statuses = []
+    body = wsgi_application(environ, lambda status, headers: statuses.append(status))
+    try:
+        b''.join(body)
+    finally:
+        body.close()
+    return int(statuses[0].split()[0])
+
+
+class ConcurrencyBenchmark(TransactionTestCase):
+    """
+    Closed-loop clients against one process: the async endpoints on the ASGI application, and
+    the DRF endpoints on the WSGI application with BENCH_WSGI_THREADS threads.
+    """
+
+    def setUp(self):
+        seed_catalog(BENCH_PRODUCTS // 10)
+        seed_carts(BENCH_PRODUCTS // 100)
+        self.product_ids = list(Product.objects.values_list('pk', flat=True))
+        self.cart_ids = [str(pk) for pk in Cart.objects.values_list('pk', flat=True)]
+        connection_created.connect(add_latency)
+        connection.execute_wrappers.append(slow_query)
+
+    def tearDown(self):
+        connection_created.disconnect(add_latency)
+        connection.execute_wrappers.remove(slow_query)
+
+    def paths(self, prefix, count, seed):
+        rng = random.Random(seed)
+        return [f'{prefix}/carts/{rng.choice(self.cart_ids)}/' if index % 2 else
+                f'{prefix}/product/{rng.choice(self.product_ids)}/' for index in range(count)]
+
+    def run_asgi(self, clients):
+        async def client(paths, timings, statuses):
+            for path in paths:
+                started = time.perf_counter()
+                statuses.append(await asgi_get(path))
+                timings.append(time.perf_counter() - started)
+
+        async def load(timings, statuses):
+            await asyncio.gather(*[client(self.paths('/async', REQUESTS_PER_CLIENT, seed), timings, statuses)
+                                   for seed in range(clients)])
+
+        timings, statuses = [], []
+        asyncio.run(load(timings, statuses))
+        return timings, statuses
+
+    def run_wsgi(self, clients):
+        worker = threading.Semaphore(BENCH_WSGI_THREADS)
+        timings, statuses = [], []
+
+        def client(paths):
+            for path in paths:
+                started = time.perf_counter()
+                with worker:
+                    statuses.append(wsgi_get(path))
+                timings.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=client, args=(self.paths('', REQUESTS_PER_CLIENT, seed),))
+                   for seed in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, statuses
+
+    def test_concurrent_clients(self):
+        rows = []
+        for clients in BENCH_CONCURRENCY:
+            for server, run in (('asgi', self.run_asgi), (f'wsgi x{BENCH_WSGI_THREADS}', self.run_wsgi)):
+                started = time.perf_counter()
+                timings, statuses = run(clients)
+                elapsed = time.perf_counter() - started
+                self.assertEqual(set(statuses), {200})
+                p50, p95 = (statistics.quantiles(timings, n=100, method='inclusive')[share - 1] * 1000
+                            for share in (50, 95))
+                rows.append((server, clients, len(timings), f'{len(timings) / elapsed:.0f}', f'{p50:.1f}',
+                             f'{p95:.1f}'))
+        report(f"Concurrent clients, {BENCH_QUERY_LATENCY_MS:g} ms per query",
+               ('server', 'clients', 'requests', 'requests/s', 'p50 ms', 'p95 ms'), rows)
+
+
+def worker_query():
+    with connections[WORKER_ALIAS].cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def worker_query_and_close():
+    # What every call did when the worker connections were closed around it.
+    worker_query()
+    connections[WORKER_ALIAS].close()
+
+
+class WorkerConnectionBenchmark(SimpleTestCase):
+    """
+    database() calls per second against an SQLite file (the in-memory test database is never
+    closed), with the worker threads reusing their connections and with one connection per call.
+    """
+
+    def test_worker_connections(self):
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == WORKER_ALIAS:
+                opened.append(connection)
+
+        async def load(function):
+            await asyncio.gather(*[database(function) for _ in range(WORKER_CALLS)])
+
+        rows = []
+        connection_created.connect(count)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                connections.settings[WORKER_ALIAS] = dict(connections['default'].settings_dict,
+                                                          NAME=os.path.join(directory, 'worker.sqlite3'))
+                for mode, function in (('one per call', worker_query_and_close), ('reused', worker_query)):
+                    opened.clear()
+                    started = time.perf_counter()
+                    asyncio.run(load(function))
+                    elapsed = time.perf_counter() - started
+                    rows.append((mode, WORKER_CALLS, len(opened), f'{WORKER_CALLS / elapsed:.0f}'))
+                for alias_connection in opened:
+                    alias_connection.inc_thread_sharing()
+                    alias_connection.close()
+        finally:
+            connection_created.disconnect(count)
+            del connections.settings[WORKER_ALIAS]
+        self.assertLess(rows[1][2], rows[0][2])
+        report("Worker thread connections", ('connections', 'calls', 'opened', 'calls/s'), rows)
@@ -0,0 +1,231 @@
+import json
+import math
+import os
+import statistics
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase
+from django.urls import URLPattern, get_resolver
+
+from ...constants import BLACK, CAPS, WHITE
+from ...export import CHUNK_SIZE
+from ...metrics import metrics
+from ...models import Cart, CartItem, Category, Customer, Product
+from ...search import rebuild_index
+from . import BENCH_PRODUCTS, report
+from .data import seed_carts, seed_catalog
+
+BENCH_CARTS = int(os.environ.get('BENCH_CARTS', BENCH_PRODUCTS // 10))
+BENCH_REQUESTS = int(os.environ.get('BENCH_REQUESTS', 30))
+# A request fails when its p95 is slower than the stored one by more than this share,
+# plus a few milliseconds so that timer noise on fast requests does not count.
+BENCH_TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 0.5))
+BENCH_SLACK_MS = float(os.environ.get('BENCH_SLACK_MS', 2))
+# BENCH_BASELINE=update stores the measured p95 values instead of checking them.
+BENCH_BASELINE = os.environ.get('BENCH_BASELINE', 'check')
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+# Lines of the cart each checkout request completes.
+CHECKOUT_LINES = 50
+# The orders export fetches the items of every CHUNK_SIZE carts with one query.
+ORDER_CHUNKS = math.ceil(BENCH_CARTS / CHUNK_SIZE)
+
+# URL namespaces of third-party apps, which are not benchmarked.
+SKIPPED_NAMESPACES = ('admin', 'rest_framework')
+
+# route: URL name, or the pattern of unnamed paths. path: formatted with the ids of the
+# seeded rows; new_* ids are fresh rows created before each request. budget: most SQL
+# queries one request may run. repeat: requests measured, BENCH_REQUESTS by default.
+# Queries are counted as in production, outside of a test transaction: an outermost
+# transaction counts its BEGIN, where inside a TestCase it would count a SAVEPOINT and a
+# RELEASE, or nothing for Django's own atomic blocks without savepoint (save, bulk_create).
+Endpoint = namedtuple('Endpoint', 'route method path budget data staff repeat', defaults=(None, False, None))
+
+
+def product_data(ids):
+    return {
+        'category': ids['category'], 'main_colour': WHITE, 'second_colour': BLACK, 'brand': "Bench",
+        'url_img': "https://img.example.com/bench.jpg", 'price': 9.5, 'current_stock': 5,
+        'description': "Bench cap",
+    }
+
+
+def customer_data(ids):
+    return {'name': "Bench", 'surname': "User", 'address': "Calle Mayor 1", 'email': "bench@example.com",
+            'phone': "600000000"}
+
+
+ENDPOINTS = [
+    Endpoint('api-root', 'GET', '/', 0),
+    Endpoint('category-list', 'GET', '/category/', 2),
+    Endpoint('category-detail', 'GET', '/category/{category}/', 2),
+    Endpoint('product-list', 'GET', '/product/?page_size=50', 2),
+    Endpoint('product-list', 'GET', f'/product/?category={CAPS}&available=true&ordering=price&facets=true', 3),
+    Endpoint('product-detail', 'GET', '/product/{product}/', 3),
+    Endpoint('product-search', 'GET', '/product/search/?q=vintage+cap', 2),
+    Endpoint('cart-list', 'GET', '/carts/', 3),
+    Endpoint('cart-detail', 'GET', '/carts/{cart}/', 3),
+    Endpoint('customer-list', 'GET', '/customers/', 1),
+    Endpoint('customer-detail', 'GET', '/customers/{customer}/', 1),
+    Endpoint('cart/<str:pk>/update', 'GET', '/cart/{cart}/update', 2),
+    Endpoint('product/<int:pk>/update', 'GET', '/product/{product}/update', 1),
+    Endpoint('export/catalog.<str:export_format>', 'GET', '/export/catalog.ndjson', 1, repeat=3),
+    Endpoint('export/orders.<str:export_format>', 'GET', '/export/orders.csv', 3 + ORDER_CHUNKS, staff=True,
+             repeat=3),
+    Endpoint('metrics', 'GET', '/metrics', 2, staff=True),
+    Endpoint('async-product-list', 'GET', '/async/product/?page_size=50', 1),
+    Endpoint('async-product-detail', 'GET', '/async/product/{product}/', 1),
+    Endpoint('async-cart-detail', 'GET', '/async/carts/{cart}/', 2),
+
+    Endpoint('category-list', 'POST', '/category/', 1, lambda ids: {'name': CAPS}),
+    Endpoint('category-detail', 'PUT', '/category/{category}/', 2, lambda ids: {'name': CAPS}),
+    Endpoint('category-detail', 'PATCH', '/category/{category}/', 2, lambda ids: {'name': CAPS}),
+    Endpoint('category-detail', 'DELETE', '/category/{new_category}/', 9),
+    Endpoint('product-list', 'POST', '/product/', 8, product_data),
+    Endpoint('product-batch', 'POST', '/product/batch/', 31,
+             lambda ids: {'create': [product_data(ids)] * 10, 'update': [{'id': ids['product'], 'price': 9}]}),
+    Endpoint('product-detail', 'PUT', '/product/{product}/', 10, product_data),
+    Endpoint('product-detail', 'PATCH', '/product/{product}/', 6, lambda ids: {'price': 9.5}),
+    Endpoint('product-detail', 'DELETE', '/product/{new_product}/', 8),
+    Endpoint('product/<int:pk>/update', 'PUT', '/product/{product}/update', 7, product_data),
+    Endpoint('product/<int:pk>/update', 'PATCH', '/product/{product}/update', 6, lambda ids: {'price': 9.5}),
+    Endpoint('product/<int:pk>/delete', 'DELETE', '/product/{new_product}/delete', 8),
+    Endpoint('cart-list', 'POST', '/carts/', 9, lambda ids: {}),
+    Endpoint('cart-detail', 'PUT', '/carts/{cart}/', 9, lambda ids: {'completed': False}),
+    Endpoint('cart-detail', 'PATCH', '/carts/{cart}/', 9, lambda ids: {'completed': False}),
+    Endpoint('cart-detail', 'DELETE', '/carts/{new_cart}/', 7),
+    Endpoint('cart-checkout', 'POST', '/carts/{checkout_cart}/checkout/', 18),
+    Endpoint('cart/<str:pk>/update', 'PUT', '/cart/{cart}/update', 9, lambda ids: {'completed': False}),
+    Endpoint('cart/<str:pk>/update', 'PATCH', '/cart/{cart}/update', 9, lambda ids: {'completed': False}),
+    Endpoint('customer-list', 'POST', '/customers/', 1, customer_data),
+    Endpoint('customer-detail', 'PUT', '/customers/{customer}/', 2, customer_data),
+    Endpoint('customer-detail', 'PATCH', '/customers/{customer}/', 2, lambda ids: {'phone': "600000001"}),
+    Endpoint('customer-detail', 'DELETE', '/customers/{new_customer}/', 2),
+]
+
+
+def route_methods():
+    """(route, method) of every view in nappstore/urls.py, as used by Endpoint.route."""
+    routes = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLPattern):
+                if '(?P<format>' in str(pattern.pattern):
+                    continue
+                callback = pattern.callback
+                if getattr(callback, 'actions', None):
+                    methods = callback.actions
+                elif hasattr(callback, 'view_class') or hasattr(callback, 'cls'):
+                    view = getattr(callback, 'view_class', None) or callback.cls
+                    methods = [name for name in view.http_method_names
+                               if name not in ('head', 'options') and hasattr(view, name)]
+                else:
+                    # Function views of store.async_views, which only read.
+                    methods = ['get']
+                routes.update((pattern.name or str(pattern.pattern), method.upper()) for method in methods)
+            elif pattern.namespace not in SKIPPED_NAMESPACES:
+                walk(pattern.url_patterns)
+
+    walk(get_resolver().url_patterns)
+    return routes
+
+
+def percentile(timings, share):
+    return statistics.quantiles(timings, n=100, method='inclusive')[share - 1]
+
+
+class EndpointBenchmark(TransactionTestCase):
+    # The async endpoints query from worker threads, whose connections only see committed rows.
+    def setUp(self):
+        categories = seed_catalog(BENCH_PRODUCTS)
+        seed_carts(BENCH_CARTS)
+        rebuild_index()
+        self.staff = User.objects.create_user('bench', password='bench', is_staff=True)
+        self.ids = {
+            'category': categories[0].pk,
+            'product': Product.objects.filter(category=categories[0]).order_by('pk').values_list('pk', flat=True)[0],
+            'cart': Cart.objects.filter(completed=False).order_by('pk').values_list('pk', flat=True)[0],
+            'customer': Customer.objects.order_by('pk').values_list('pk', flat=True)[0],
+        }
+
+    def fresh_ids(self):
+        category = Category.objects.create(name=CAPS)
+        return {
+            'new_category': category.pk,
+            'new_product': Product.objects.create(category=category, main_colour=WHITE, second_colour=BLACK,
+                                                  brand="Bench", url_img="https://img.example.com/bench.jpg",
+                                                  price=1, current_stock=1, description="Bench").pk,
+            'new_cart': Cart.objects.create(owner=f"session:bench-new-{category.pk}", completed=True).pk,
+            'new_customer': Customer.objects.create(name="Bench", surname="New", address="-", email="new@example.com",
+                                                    phone="-").pk,
+        }
+
+    def checkout_cart(self, lines=CHECKOUT_LINES):
+        cart = Cart.objects.create(owner=f"session:bench-checkout-{Cart.objects.count()}")
+        Customer.objects.create(cart=cart, name="Bench", surname="Checkout", address="-", email="checkout@example.com",
+                                phone="-")
+        for product_id in Product.objects.filter(current_stock__gte=10).order_by('?').values_list(
+                'pk', flat=True)[:lines]:
+            CartItem(cart=cart, product_id=product_id, quantity=1).save()
+        return cart.pk
+
+    def request(self, endpoint):
+        ids = dict(self.ids, **(self.fresh_ids() if '{new_' in endpoint.path else {}))
+        if '{checkout_cart}' in endpoint.path:
+            ids['checkout_cart'] = self.checkout_cart()
+        data = json.dumps(endpoint.data(ids)) if endpoint.data else None
+        if endpoint.staff:
+            self.client.force_login(self.staff)
+        else:
+            self.client.logout()
+        kwargs = {'data': data, 'content_type': 'application/json'} if data is not None else {}
+        # Queries are counted by the metrics middleware, wherever the view runs them.
+        metrics.reset()
+        started = time.perf_counter()
+        response = getattr(self.client, endpoint.method.lower())(endpoint.path.format(**ids), **kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - started) * 1000
+        queries = sum(values[-1] for (name, _), values in metrics.histograms.items()
+                      if name == 'db_queries_per_request')
+        return response.status_code, queries, elapsed
+
+    def test_endpoints(self):
+        missing = route_methods() - {(endpoint.route, endpoint.method) for endpoint in ENDPOINTS}
+        self.assertFalse(missing, "Routes without a declared query budget.")
+
+        baselines = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        baseline = baselines.get(str(BENCH_PRODUCTS), {})
+        measured, rows, failures = {}, [], []
+        for endpoint in ENDPOINTS:
+            name = f"{endpoint.method} {endpoint.path}"
+            results = [self.request(endpoint) for _ in range(endpoint.repeat or BENCH_REQUESTS)]
+            statuses = {status for status, _, _ in results}
+            queries = max(count for _, count, _ in results)
+            timings = [elapsed for _, _, elapsed in results]
+            p50, p95, p99 = (percentile(timings, share) for share in (50, 95, 99))
+            measured[name] = round(p95, 2)
+            rows.append((name, ','.join(map(str, sorted(statuses))), queries, endpoint.budget,
+                         f'{p50:.2f}', f'{p95:.2f}', f'{p99:.2f}', baseline.get(name, '-')))
+
+            if any(status >= 400 for status in statuses):
+                failures.append(f"{name} answered {sorted(statuses)}.")
+            if queries > endpoint.budget:
+                failures.append(f"{name} ran {queries} queries, its budget is {endpoint.budget}.")
+            if BENCH_BASELINE == 'update':
+                continue
+            if name not in baseline:
+                failures.append(f"{name} has no baseline for {BENCH_PRODUCTS} products,"
+                                " store one with BENCH_BASELINE=update.")
+            elif p95 > baseline[name] * (1 + BENCH_TOLERANCE) + BENCH_SLACK_MS:
+                failures.append(f"{name} p95 is {p95:.2f} ms, the baseline is {baseline[name]} ms.")
+
+        report(f"Endpoints, {BENCH_PRODUCTS} products and {BENCH_CARTS} carts",
+               ('request', 'status', 'queries', 'budget', 'p50 ms', 'p95 ms', 'p99 ms', 'baseline p95'), rows)
+        if BENCH_BASELINE == 'update':
+            baselines[str(BENCH_PRODUCTS)] = measured
+            BASELINE_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        self.assertFalse(failures, '\n'.join(failures))
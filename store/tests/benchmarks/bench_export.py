@@ -0,0 +1,29 @@
+import time
+import tracemalloc
+
+from django.test import TestCase
+
+from ...export import export_chunks
+from . import BENCH_PRODUCTS, report
+from .data import seed_catalog
+
+
+class ExportBenchmark(TestCase):
+    def measure(self, export_format):
+        tracemalloc.start()
+        started, size = time.perf_counter(), 0
+        for chunk in export_chunks('catalog', export_format):
+            size += len(chunk)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return f'{size / 2**20:.1f}', f'{elapsed:.2f}', f'{peak / 2**20:.2f}'
+
+    def test_memory_is_flat(self):
+        rows, seeded = [], 0
+        for products in (BENCH_PRODUCTS // 10, BENCH_PRODUCTS):
+            seed_catalog(products - seeded, start=seeded)
+            seeded = products
+            for export_format in ('ndjson', 'csv'):
+                rows.append((products, export_format) + self.measure(export_format))
+        report("Catalog export", ('products', 'format', 'MiB out', 'seconds', 'peak MiB'), rows)
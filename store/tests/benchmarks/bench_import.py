@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from ...models import Category, Product
+from . import BENCH_PRODUCTS, report
+from .data import catalog_rows
+
+# loaddata reads the whole fixture into memory, so it is only timed up to this size.
+LOADDATA_PRODUCTS = int(os.environ.get('BENCH_LOADDATA_PRODUCTS', 20000))
+
+
+class ImportBenchmark(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_ndjson(self, count):
+        path = os.path.join(self.directory, f'catalog-{count}.ndjson')
+        with open(path, 'w') as file:
+            for row in catalog_rows(count):
+                file.write(json.dumps(row) + '\n')
+        return path
+
+    def write_fixture(self, count):
+        path = os.path.join(self.directory, f'fixture-{count}.json')
+        objects = [{'model': 'store.category', 'pk': pk, 'fields': {'name': name, 'created': '2022-01-01',
+                                                                    'updated': '2022-01-01'}}
+                   for pk, name in ((1, 'caps'), (2, 'tshirts'))]
+        for pk, row in enumerate(catalog_rows(count), 1):
+            fields = dict(row, category=1 if row.pop('category') == 'caps' else 2, inclusion_date='2022-01-01',
+                          updated='2022-01-01')
+            objects.append({'model': 'store.product', 'pk': pk, 'fields': fields})
+        with open(path, 'w') as file:
+            json.dump(objects, file)
+        return path
+
+    def measure(self, command, *args):
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        tracemalloc.start()
+        started = time.perf_counter()
+        call_command(command, *args, stdout=StringIO(), verbosity=0)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak
+
+    def test_import_against_loaddata(self):
+        rows = []
+        for count in sorted({min(BENCH_PRODUCTS, LOADDATA_PRODUCTS), BENCH_PRODUCTS}):
+            elapsed, peak = self.measure('import_catalog', self.write_ndjson(count))
+            self.assertEqual(Product.objects.count(), count)
+            rows.append(('import_catalog', count, f'{elapsed:.2f}', f'{count / elapsed:.0f}', f'{peak / 2**20:.1f}'))
+            if count <= LOADDATA_PRODUCTS:
+                elapsed, peak = self.measure('loaddata', self.write_fixture(count))
+                rows.append(('loaddata', count, f'{elapsed:.2f}', f'{count / elapsed:.0f}', f'{peak / 2**20:.1f}'))
+        report("Catalog import", ('command', 'rows', 'seconds', 'rows/s', 'peak MiB'), rows)
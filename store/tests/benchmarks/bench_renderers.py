@@ -0,0 +1,44 @@
+import datetime
+import os
+import uuid
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from ...fast import compile_serializer
+from ...models import Product
+from ...renderers import FastJSONRenderer, MessagePackRenderer
+from ...serializers import ProductSerializer
+from . import report, timed
+from .data import seed_catalog
+
+SIZES = [int(size) for size in os.environ.get('BENCH_RENDERER_ROWS', '100,1000,10000,50000').split(',')]
+
+
+def cart_payload(size):
+    # Raw UUIDs and datetimes, which the renderers encode themselves.
+    created = datetime.datetime(2023, 12, 1, 10, 30)
+    return [{'id': uuid.uuid4(), 'created': created, 'item_count': index % 7, 'total': index * 1.5,
+             'completed': bool(index % 2)} for index in range(size)]
+
+
+class RendererBenchmark(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(max(SIZES))
+
+    def test_encode_time(self):
+        compiled = compile_serializer(ProductSerializer)
+        renderers = [('drf json', JSONRenderer()), ('orjson', FastJSONRenderer())]
+        if MessagePackRenderer.available:
+            renderers.append(('msgpack', MessagePackRenderer()))
+        rows = []
+        for size in SIZES:
+            payloads = [('products', compiled.data(compiled.rows(Product.objects.order_by('pk')[:size]))),
+                        ('carts', cart_payload(size))]
+            for payload_name, payload in payloads:
+                for renderer_name, renderer in renderers:
+                    elapsed = timed(lambda: renderer.render(payload), repeat=3)
+                    rows.append((payload_name, size, renderer_name, f'{elapsed:.2f}',
+                                 f'{len(renderer.render(payload)) / 1024:.0f}'))
+        report("Encode time per payload (median ms)", ('payload', 'rows', 'renderer', 'ms', 'KiB'), rows)
@@ -0,0 +1,33 @@
+from django.db.models import Q
+from django.test import TestCase
+
+from ...models import Product
+from ...search import TOKEN_RE, rebuild_index, search_product_ids
+from . import BENCH_PRODUCTS, report, timed
+from .data import seed_catalog
+
+QUERIES = ['nik', 'trucker cap', 'vintage red', 'organic polo', 'edition 4242']
+
+
+def icontains_ids(query, limit):
+    condition = Q()
+    for token in TOKEN_RE.findall(query):
+        condition &= Q(description__icontains=token) | Q(brand__icontains=token)
+    return list(Product.objects.filter(condition).values_list('id', flat=True)[:limit])
+
+
+class SearchBenchmark(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(BENCH_PRODUCTS)
+        rebuild_index()
+
+    def test_fts_against_icontains(self):
+        rows = []
+        for query in QUERIES:
+            for limit in (20, BENCH_PRODUCTS):
+                fts = timed(lambda: search_product_ids(query, limit))
+                scan = timed(lambda: icontains_ids(query, limit))
+                rows.append((query, limit, len(search_product_ids(query, limit)), f'{fts:.2f}', f'{scan:.2f}'))
+        report(f"Search over {BENCH_PRODUCTS} products (median ms)",
+               ('query', 'limit', 'matches', 'fts5', 'icontains'), rows)
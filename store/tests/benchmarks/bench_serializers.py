@@ -0,0 +1,36 @@
+import os
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from ...fast import compile_serializer
+from ...models import Product
+from ...serializers import ProductSerializer, CapSerializer, TShirtSerializer, SimpleProductSerializer, \
+    plan_queryset
+from . import report, timed
+from .data import seed_catalog
+
+ROWS = [int(size) for size in os.environ.get('BENCH_SERIALIZER_ROWS', '1000,10000,100000').split(',')]
+
+
+class SerializerBenchmark(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(max(ROWS))
+
+    def test_compiled_against_drf(self):
+        rows = []
+        for serializer_class in (ProductSerializer, CapSerializer, TShirtSerializer, SimpleProductSerializer):
+            compiled = compile_serializer(serializer_class)
+            for size in ROWS:
+                queryset = Product.objects.order_by('pk')[:size]
+                repeat = 1 if size > 10000 else 3
+                drf = timed(lambda: serializer_class(plan_queryset(queryset, serializer_class), many=True).data, repeat)
+                fast = timed(lambda: compiled.data(compiled.rows(queryset)), repeat)
+                if size == min(ROWS):
+                    self.assertEqual(JSONRenderer().render(compiled.data(compiled.rows(queryset))),
+                                     JSONRenderer().render(serializer_class(queryset, many=True).data))
+                rows.append((serializer_class.__name__, size, f'{size / drf * 1000:.0f}', f'{size / fast * 1000:.0f}',
+                             f'{drf / fast:.1f}x'))
+        report("Serialization throughput (rows/s, including the query)",
+               ('serializer', 'rows', 'drf', 'compiled', 'speedup'), rows)
@@ -0,0 +1,35 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from . import report
+from .writers import PROFILES, prepare, write_carts
+
+BENCH_WRITERS = [int(writers) for writers in os.environ.get('BENCH_WRITERS', '1,2,4,8').split(',')]
+CARTS, ITEMS = 20, 5
+
+
+class SQLiteWriteBenchmark(SimpleTestCase):
+    """Cart lines written per second by concurrent processes, with SQLite's defaults and with store.sqlite."""
+
+    def test_concurrent_cart_writes(self):
+        context = multiprocessing.get_context('spawn')
+        rows = []
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in PROFILES:
+                path = os.path.join(directory, f'{profile}.sqlite3')
+                with context.Pool(1) as pool:
+                    pool.apply(prepare, (profile, path, 10000))
+                for writers in BENCH_WRITERS:
+                    start_at = time.time() + 3
+                    with context.Pool(writers) as pool:
+                        results = pool.starmap(write_carts, [(profile, path, worker, CARTS, ITEMS, start_at)
+                                                             for worker in range(writers)])
+                    written = sum(result[0] for result in results)
+                    locked = sum(result[1] for result in results)
+                    seconds = max(result[3] for result in results) - min(result[2] for result in results)
+                    rows.append((profile, writers, written, locked, f'{written / seconds:.0f}'))
+        report("Concurrent cart writes", ('profile', 'writers', 'lines', 'locked errors', 'lines/s'), rows)
@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from . import report
+from .writers import prepare_hot_product, reserve_units
+
+BENCH_WRITERS = [int(writers) for writers in os.environ.get('BENCH_WRITERS', '1,2,4,8').split(',')]
+BENCH_SHARDS = int(os.environ.get('BENCH_SHARDS', 8))
+ATTEMPTS = 200
+
+
+class HotProductBenchmark(SimpleTestCase):
+    """Reservations of one product per second by concurrent processes, on its single row and on shards."""
+
+    def test_concurrent_reservations(self):
+        context = multiprocessing.get_context('spawn')
+        rows = []
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, shards in (('single row', 0), (f'{BENCH_SHARDS} shards', BENCH_SHARDS)):
+                path = os.path.join(directory, f'{shards}.sqlite3')
+                with context.Pool(1) as pool:
+                    product_id = pool.apply(prepare_hot_product, (path, shards))
+                for writers in BENCH_WRITERS:
+                    start_at = time.time() + 3
+                    with context.Pool(writers) as pool:
+                        results = pool.starmap(reserve_units, [(path, product_id, ATTEMPTS, start_at)
+                                                               for _ in range(writers)])
+                    reserved = sum(result[0] for result in results)
+                    locked = sum(result[1] for result in results)
+                    seconds = max(result[3] for result in results) - min(result[2] for result in results)
+                    rows.append((mode, writers, reserved, locked, f'{reserved / seconds:.0f}'))
+        report("Concurrent reservations of a hot product",
+               ('mode', 'writers', 'units', 'locked errors', 'units/s'), rows)
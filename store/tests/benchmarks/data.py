@@ -0,0 +1,85 @@
+import random
+from array import array
+
+from ...constants import COLOURS, SIZE, SIZING, FABRIC, CAPS, TSHIRTS
+from ...models import Category, Product, Cart, CartItem, Customer
+
+BRANDS = ["Nike", "Adidas", "Puma", "Reebok", "New Balance", "Vans", "Converse", "Fila", "Umbro", "Kappa"]
+ADJECTIVES = ["classic", "vintage", "trucker", "sport", "slim", "oversize", "organic", "retro", "summer", "winter"]
+ITEMS = {CAPS: ["cap", "snapback", "beanie", "visor"], TSHIRTS: ["tshirt", "tank", "polo", "jersey"]}
+NAMES = ["Ana", "Luis", "Marta", "Pablo", "Lucia", "Jorge", "Elena", "Hugo", "Sara", "Diego"]
+SURNAMES = ["Garcia", "Lopez", "Martin", "Sanchez", "Perez", "Gomez", "Ruiz", "Diaz", "Moreno", "Alonso"]
+
+
+def catalog_rows(products, seed=1, start=0):
+    """Reproducible synthetic catalog rows, in the format read by import_catalog."""
+    rng = random.Random(seed)
+    for index in range(start, start + products):
+        category = (CAPS, TSHIRTS)[index % 2]
+        colour = rng.choice(COLOURS)[0]
+        row = {
+            'sku': f"SKU-{index:07d}",
+            'category': category,
+            'main_colour': colour,
+            'second_colour': rng.choice(COLOURS)[0],
+            'logo_colour': rng.choice(COLOURS)[0],
+            'brand': rng.choice(BRANDS),
+            'url_img': f"https://img.example.com/{index}.jpg",
+            'price': round(rng.uniform(5, 80), 2),
+            'initial_stock': 50,
+            'current_stock': rng.randint(0, 50),
+            'description': f"{rng.choice(ADJECTIVES)} {colour} {rng.choice(ITEMS[category])} "
+                           f"{rng.choice(ADJECTIVES)} edition {index}",
+        }
+        if category == TSHIRTS:
+            row.update(size=rng.choice(SIZE)[0], sizing=rng.choice(SIZING)[0], fabric=rng.choice(FABRIC)[0])
+        yield row
+
+
+def seed_catalog(products, batch_size=5000, seed=1, start=0):
+    """Bulk insert a synthetic catalog, bypassing model signals."""
+    categories = {name: Category.objects.get_or_create(name=name)[0] for name in (CAPS, TSHIRTS)}
+    batch = []
+    for row in catalog_rows(products, seed, start):
+        batch.append(Product(**dict(row, category=categories[row['category']])))
+        if len(batch) == batch_size:
+            Product.objects.bulk_create(batch)
+            batch = []
+    Product.objects.bulk_create(batch)
+    return list(categories.values())
+
+
+def seed_carts(carts, items_per_cart=5, batch_size=5000, seed=1, completed=0.75):
+    """
+    Bulk insert carts over the seeded catalog, with their items, stored totals and one customer
+    each, bypassing CartItem.save: stock is not reserved. `completed` is the share of closed carts.
+    """
+    rng = random.Random(seed)
+    # Two flat arrays keep a million products in a few MiB.
+    product_ids, prices = array('q'), array('d')
+    for pk, price in Product.objects.order_by('pk').values_list('pk', 'price').iterator(chunk_size=batch_size):
+        product_ids.append(pk)
+        prices.append(price)
+
+    cart_batch, item_batch, customer_batch = [], [], []
+    for index in range(carts):
+        cart = Cart(owner=f"session:bench-{seed}-{index}", completed=rng.random() < completed)
+        for _ in range(rng.randint(1, 2 * items_per_cart - 1)):
+            position, quantity = rng.randrange(len(product_ids)), rng.randint(1, 3)
+            item_batch.append(CartItem(cart=cart, product_id=product_ids[position], quantity=quantity))
+            cart.item_count += quantity
+            cart.total_amount += quantity * prices[position]
+        name, surname = rng.choice(NAMES), rng.choice(SURNAMES)
+        customer_batch.append(Customer(cart=cart, name=name, surname=surname, address=f"Calle Mayor {index}",
+                                       email=f"{name}.{surname}.{index}@example.com".lower(), phone=f"6{index:08d}"))
+        cart_batch.append(cart)
+        if len(cart_batch) == batch_size:
+            flush_carts(cart_batch, item_batch, customer_batch, batch_size)
+            cart_batch, item_batch, customer_batch = [], [], []
+    flush_carts(cart_batch, item_batch, customer_batch, batch_size)
+
+
+def flush_carts(carts, items, customers, batch_size):
+    Cart.objects.bulk_create(carts)
+    CartItem.objects.bulk_create(items, batch_size=batch_size)
+    Customer.objects.bulk_create(customers)
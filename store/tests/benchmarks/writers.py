@@ -0,0 +1,90 @@
+"""
+Writer processes of bench_sqlite and bench_stock. They are started with the spawn method, so this module
+imports Django lazily: each process points the default database to the benchmark file
+before django.setup().
+"""
+import random
+import time
+
+PROFILES = ('default', 'production')
+
+
+def configure(profile, path):
+    from django.conf import settings
+
+    database = dict(settings.DATABASES['default'], NAME=path)
+    if profile == 'default':
+        # Django's own backend with SQLite's defaults: rollback journal and deferred BEGIN.
+        database['ENGINE'] = 'django.db.backends.sqlite3'
+        database.pop('PRAGMAS', None)
+    settings.DATABASES['default'] = database
+    settings.DEBUG = False
+
+    import django
+    django.setup()
+
+
+def prepare(profile, path, products):
+    configure(profile, path)
+    from django.core.management import call_command
+    from store.models import Product
+    from .data import seed_catalog
+
+    call_command('migrate', verbosity=0)
+    seed_catalog(products)
+    Product.objects.update(current_stock=10 ** 9)
+
+
+def write_carts(profile, path, worker, carts, items, start_at):
+    """Fills `carts` carts of `items` lines each. Returns (lines written, locked errors, start, end)."""
+    configure(profile, path)
+    from django.db import OperationalError
+    from store.models import Cart, CartItem, Product
+
+    rng = random.Random(worker)
+    product_ids = list(Product.objects.values_list('pk', flat=True))
+    written = locked = 0
+    time.sleep(max(0, start_at - time.time()))
+    started = time.time()
+    for index in range(carts):
+        try:
+            cart = Cart.objects.create(owner=f"session:{profile}-{worker}-{index}-{start_at}")
+            for product_id in rng.sample(product_ids, items):
+                CartItem(cart=cart, product_id=product_id, quantity=1).save()
+                written += 1
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            locked += 1
+    return written, locked, started, time.time()
+
+
+def prepare_hot_product(path, shards):
+    """A catalog of one product, its stock split across `shards` counters; the product's id."""
+    prepare('production', path, 1)
+    from store.models import Product
+    from store.stock import set_stock_shards
+
+    product_id = Product.objects.get().pk
+    set_stock_shards(product_id, shards)
+    return product_id
+
+
+def reserve_units(path, product_id, attempts, start_at):
+    """Reserves one unit `attempts` times. Returns (units reserved, locked errors, start, end)."""
+    configure('production', path)
+    from django.db import OperationalError
+    from store.stock import reserve_stock
+
+    reserved = locked = 0
+    time.sleep(max(0, start_at - time.time()))
+    started = time.time()
+    for _ in range(attempts):
+        try:
+            reserve_stock(product_id, 1)
+            reserved += 1
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            locked += 1
+    return reserved, locked, started, time.time()
@@ -20,8 +20,14 @@ class CategoryFactory(DjangoModelFactory):
         model = Category
 
 
+def default_category():
+    # Products without an explicit category share the first caps category instead of
+    # creating one each. Bulk volumes come from store.tests.benchmarks.data.
+    return Category.objects.filter(name=CAPS).order_by('pk').first() or CategoryFactory()
+
+
 class ProductFactory(DjangoModelFactory):
-    category = factory.SubFactory(CategoryFactory)
+    category = factory.LazyFunction(default_category)
     main_colour = WHITE
     second_colour = BLACK
     logo_colour = BLUE
@@ -42,6 +48,8 @@ class ProductFactory(DjangoModelFactory):
 
 
 class CartFactory(DjangoModelFactory):
+    owner = factory.Sequence(lambda n: f"session:test-{n}")
+
     class Meta:
         model = Cart
 
@@ -0,0 +1,90 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections
+from django.test import TransactionTestCase
+
+from .. import aio
+from ..aio import database
+from ..cache import catalog_cache
+from ..constants import CAPS, TSHIRTS
+from ..metrics import metrics
+from .factories import CartFactory, CartItemFactory, CategoryFactory, ProductFactory
+
+
+class AsyncViewsTest(TransactionTestCase):
+    """
+    The async endpoints answer what their DRF counterparts answer. TransactionTestCase, because
+    their queries run in worker threads, with connections that only see committed rows.
+    """
+
+    def setUp(self):
+        catalog_cache.cache.clear()
+        caps, tshirts = CategoryFactory(name=CAPS), CategoryFactory(name=TSHIRTS)
+        self.products = [ProductFactory(category=caps if index % 2 else tshirts, price=index) for index in range(5)]
+        self.cart = CartFactory()
+        for product in self.products[:3]:
+            CartItemFactory(cart=self.cart, product=product, quantity=2)
+
+    async def get(self, path):
+        sync_response = await sync_to_async(self.client.get)(path)
+        async_response = await self.async_client.get('/async' + path)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response['Content-Type'], 'application/json')
+        return json.loads(sync_response.content), json.loads(async_response.content)
+
+    async def test_product_list(self):
+        for path in ('/product/', f'/product/?category={CAPS}&ordering=-price&facets=true', '/product/?page_size=2'):
+            expected, data = await self.get(path)
+            self.assertEqual(data['results'], expected['results'])
+            self.assertEqual(data.get('facets'), expected.get('facets'))
+
+        expected, data = await self.get('/product/?page_size=2')
+        self.assertTrue(data['next'].startswith('http://testserver/async/product/?'))
+        expected, second = await self.get(data['next'].split('/async', 1)[1])
+        self.assertEqual(second['results'], expected['results'])
+        self.assertEqual(len(second['results']), 2)
+
+    async def test_errors(self):
+        expected, data = await self.get('/product/?ordering=brand')
+        self.assertEqual(data, expected)
+        expected, data = await self.get(f'/product/{self.products[-1].pk + 1}/')
+        self.assertEqual(data, expected)
+
+    async def test_product_detail(self):
+        for _ in range(2):
+            expected, data = await self.get(f'/product/{self.products[0].pk}/')
+            self.assertEqual(data, expected)
+
+    async def test_cart_detail(self):
+        expected, data = await self.get(f'/carts/{self.cart.pk}/')
+        self.assertEqual(data, expected)
+        self.assertEqual(len(data['items']), 3)
+
+    async def test_queries_are_counted_in_worker_threads(self):
+        metrics.reset()
+        await self.async_client.get(f'/async/carts/{self.cart.pk}/')
+        queries = metrics.histograms[('db_queries_per_request', (('route', 'async-cart-detail'), ('method', 'GET')))]
+        self.assertEqual(queries[-1], 2)
+
+    async def test_worker_connections_are_reused(self):
+        # SQLite never closes the in-memory test database, so the close() calls are observed.
+        def worker_connection():
+            connection.ensure_connection()
+            return threading.get_ident(), connection.connection
+
+        with mock.patch.object(aio, 'executor', ThreadPoolExecutor(max_workers=1)) as executor, \
+                mock.patch.object(type(connections['default']), 'close', autospec=True) as close:
+            worker, first = await database(worker_connection)
+            self.assertNotEqual(worker, threading.get_ident())
+            self.assertEqual(await database(worker_connection), (worker, first))
+            close.assert_not_called()
+
+            with self.subTest("Outlived CONN_MAX_AGE"), mock.patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 60}):
+                await database(setattr, connection, 'close_at', 0)
+                await database(worker_connection)
+                close.assert_called_once()
+        executor.shutdown()
@@ -0,0 +1,57 @@
+from django.core.cache import caches
+from rest_framework.test import APITestCase
+
+from ..cache import catalog_cache
+from ..constants import CAPS, TSHIRTS
+from ..stock import compact_stock, reserve_stock
+from .factories import CategoryFactory, ProductFactory
+
+
+class CatalogCacheTest(APITestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.caps = CategoryFactory(name=CAPS)
+        self.tshirts = CategoryFactory(name=TSHIRTS)
+        self.cap = ProductFactory(category=self.caps)
+        self.tshirt = ProductFactory(category=self.tshirts)
+
+    def test_list_is_served_from_cache(self):
+        hits = catalog_cache.stats()['hits']
+        first = self.client.get('/product/').json()
+        # Only the conditional GET validators reach the database.
+        with self.assertNumQueries(1):
+            second = self.client.get('/product/').json()
+        self.assertEqual(first, second)
+        self.assertEqual(catalog_cache.stats()['hits'], hits + 1)
+
+    def test_writes_invalidate_list(self):
+        self.client.get('/product/')
+
+        with self.subTest("Product update"):
+            response = self.client.patch(f'/product/{self.cap.id}/update', {'brand': 'Nike'})
+            self.assertEqual(response.status_code, 200)
+            brands = [product['brand'] for product in self.client.get('/product/').json()['results']]
+            self.assertIn('Nike', brands)
+
+        with self.subTest("Stock change"):
+            reserve_stock(self.cap.id, 8)
+            compact_stock()
+            products = self.client.get('/product/').json()['results']
+            self.assertFalse(next(p for p in products if p['id'] == self.cap.id)['product_available'])
+
+        with self.subTest("Product delete"):
+            self.client.delete(f'/product/{self.tshirt.id}/delete')
+            self.assertEqual(len(self.client.get('/product/').json()['results']), 1)
+
+    def test_detail_is_invalidated_per_category(self):
+        self.client.get(f'/product/{self.cap.id}/')
+        self.client.get(f'/product/{self.tshirt.id}/')
+
+        self.client.patch(f'/product/{self.tshirt.id}/', {'brand': 'Adidas'})
+        with self.assertNumQueries(1):
+            self.client.get(f'/product/{self.cap.id}/')
+        response = self.client.get(f'/product/{self.tshirt.id}/').json()
+        self.assertEqual(response['brand'], 'Adidas')
+
+    def test_missing_product(self):
+        self.assertEqual(self.client.get('/product/999/').status_code, 404)
@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..constants import CAPS, TSHIRTS
+from ..importer import read_json
+from ..models import Cart, Category, Product
+from .factories import CategoryFactory, ProductFactory, CartFactory, CartItemFactory
+
+
+class CartTotalsTest(TestCase):
+    def setUp(self):
+        self.cart = CartFactory()
+        self.cap = ProductFactory(category=CategoryFactory(name=CAPS), price=10)
+        self.cart_item = CartItemFactory(cart=self.cart, product=self.cap, quantity=2)
+
+    def assertTotals(self, item_count, total_amount):
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, item_count)
+        self.assertAlmostEqual(self.cart.total_amount, total_amount)
+
+    def test_totals_follow_cart_items(self):
+        self.assertTotals(2, 20)
+
+        with self.subTest("Changed"):
+            self.cart_item.quantity = 3
+            self.cart_item.save()
+            self.assertTotals(3, 30)
+
+        with self.subTest("Created"):
+            CartItemFactory(cart=self.cart, product=ProductFactory(category=self.cap.category, price=5), quantity=1)
+            self.assertTotals(4, 35)
+
+        with self.subTest("Deleted"):
+            self.cart_item.delete()
+            self.assertTotals(1, 5)
+
+    def test_repair_cart_totals(self):
+        Cart.objects.filter(pk=self.cart.pk).update(item_count=7, total_amount=1)
+        empty = CartFactory()
+
+        out = StringIO()
+        call_command('repair_cart_totals', '--dry-run', stdout=out)
+        self.assertIn("Checked 2 carts, 1 drifted.", out.getvalue())
+        self.assertTotals(7, 1)
+
+        call_command('repair_cart_totals', '--batch-size=1', stdout=out)
+        self.assertIn("Checked 2 carts, 1 repaired.", out.getvalue())
+        self.assertTotals(2, 20)
+        empty.refresh_from_db()
+        self.assertEqual((empty.item_count, empty.total_amount), (0, 0))
+
+
+class ImportCatalogTest(TestCase):
+    row = {
+        'sku': 'CAP-1', 'category': CAPS, 'main_colour': 'black', 'second_colour': 'white', 'brand': 'Nike',
+        'url_img': 'https://img.example.com/cap-1.jpg', 'price': 12.5, 'current_stock': 8, 'description': 'BK Cap',
+    }
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def import_catalog(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_upsert_by_sku(self):
+        rows = [self.row, dict(self.row, sku='TS-1', category=TSHIRTS, size='small', fabric='lycra')]
+        out, _ = self.import_catalog(self.write_file('.json', json.dumps(rows)), '--batch-size=1')
+        self.assertIn("2 created, 0 updated, 0 invalid", out)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Product.objects.get(sku='TS-1').category.name, TSHIRTS)
+        self.assertEqual(Product.objects.get(sku='CAP-1').initial_stock, 8)
+
+        lines = "\n".join(json.dumps(dict(self.row, price=10, current_stock=3, sku=sku)) for sku in ('CAP-1', 'CAP-2'))
+        out, _ = self.import_catalog(self.write_file('.ndjson', lines))
+        self.assertIn("1 created, 1 updated", out)
+        cap = Product.objects.get(sku='CAP-1')
+        self.assertEqual((cap.price, cap.current_stock, cap.initial_stock), (10, 3, 8))
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_csv_rows_are_validated(self):
+        content = ("sku,category,main_colour,second_colour,brand,url_img,price,current_stock,description,size\n"
+                   "C1,caps,black,white,Nike,https://img.example.com/1.jpg,12,4,Cap,\n"
+                   "C2,caps,purple,white,Nike,https://img.example.com/2.jpg,12,4,Cap,\n"
+                   "C3,hats,black,white,Nike,https://img.example.com/3.jpg,-1,4,Cap,\n"
+                   "C4,caps,black,white,Nike,,12,4,Cap,\n")
+        out, err = self.import_catalog(self.write_file('.csv', content))
+        self.assertIn("4 rows", out)
+        self.assertIn("1 created, 0 updated, 3 invalid", out)
+        self.assertIn("Row 2: main_colour: 'purple' is not a valid choice.", err)
+        self.assertIn("Row 4: Missing fields: url_img.", err)
+        self.assertEqual(list(Product.objects.values_list('sku', 'size')), [('C1', None)])
+
+        out, err = self.import_catalog(self.write_file('.csv', content), '--max-errors=1')
+        self.assertIn("0 created, 1 updated, 3 invalid", out)
+        self.assertEqual(err.splitlines(), ["Row 2: main_colour: 'purple' is not a valid choice."])
+
+    def test_json_is_read_in_chunks(self):
+        rows = [dict(self.row, sku=f'CAP-{n}', description='"quoted", [bracketed]') for n in range(50)]
+        stream = StringIO(json.dumps(rows, indent=2))
+        self.assertEqual(list(read_json(stream, chunk_size=7)), rows)
+        with self.assertRaises(ValueError):
+            list(read_json(StringIO(json.dumps(rows)[:-20]), chunk_size=7))
@@ -0,0 +1,68 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..constants import CAPS
+from ..models import Cart
+from .factories import CategoryFactory, ProductFactory, CartFactory, CartItemFactory
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.caps = CategoryFactory(name=CAPS)
+        self.cap = ProductFactory(category=self.caps, price=10, sku='CAP-1', description='Black, "classic" cap')
+        self.tee = ProductFactory(category=self.caps, price=4)
+        self.carts = CartFactory.create_batch(3)
+        for cart in self.carts:
+            CartItemFactory(cart=cart, product=self.cap, quantity=2)
+            CartItemFactory(cart=cart, product=self.tee, quantity=1)
+        Cart.objects.filter(pk__in=[cart.pk for cart in self.carts[:2]]).update(completed=True)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_catalog_ndjson(self):
+        response = self.client.get('/export/catalog.ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.cap.pk, self.tee.pk])
+        self.assertEqual((rows[0]['sku'], rows[0]['category'], rows[0]['description']),
+                         ('CAP-1', CAPS, 'Black, "classic" cap'))
+
+    def test_orders_csv_with_gzip(self):
+        self.assertEqual(self.client.get('/export/orders.csv').status_code, 403)
+        self.client.force_login(User.objects.create_user('finance', is_staff=True))
+        self.assertEqual(self.client.get('/export/orders.xml').status_code, 404)
+
+        with self.assertNumQueries(4):
+            response = self.client.get('/export/orders.csv', HTTP_ACCEPT_ENCODING='gzip')
+            content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['cart_id'] for row in rows}, {str(cart.pk) for cart in self.carts[:2]})
+        self.assertEqual([(row['quantity'], row['sub_total']) for row in rows[:2]], [('2', '20.0'), ('1', '4.0')])
+
+    def test_command(self):
+        handle, path = tempfile.mkstemp(suffix='.ndjson.gz')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('export', 'orders', '--gzip', f'--output={path}', '--chunk-size=1', stdout=StringIO())
+        with gzip.open(path, 'rt') as file:
+            carts = [json.loads(line) for line in file]
+        self.assertEqual(len(carts), 2)
+        self.assertEqual([item['quantity'] for item in carts[0]['items']], [2, 1])
+        self.assertEqual(carts[0]['total_amount'], 24)
+
+        out = StringIO()
+        call_command('export', 'catalog', '--format=csv', stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[0].split(','), ['id', 'sku', 'category', 'main_colour',
+                         'second_colour', 'logo_colour', 'brand', 'inclusion_date', 'url_img', 'price',
+                         'current_stock', 'description', 'size', 'sizing', 'fabric', 'sleeve'])
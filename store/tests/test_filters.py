@@ -0,0 +1,56 @@
+from rest_framework.test import APITestCase
+
+from ..constants import CAPS, TSHIRTS, RED, BLUE, WHITE, SIZE_M, LYCRA
+from .factories import CategoryFactory, ProductFactory
+
+
+class ProductFilterTest(APITestCase):
+    def setUp(self):
+        caps = CategoryFactory(name=CAPS)
+        tshirts = CategoryFactory(name=TSHIRTS)
+        self.red_cap = ProductFactory(category=caps, main_colour=RED, brand="Nike", price=12, current_stock=0)
+        self.blue_cap = ProductFactory(category=caps, main_colour=BLUE, brand="Adidas", price=30)
+        self.tshirt = ProductFactory(category=tshirts, main_colour=RED, brand="Nike", price=20,
+                                     size=SIZE_M, fabric=LYCRA)
+
+    def ids(self, query):
+        response = self.client.get(f'/product/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [product['id'] for product in response.json()['results']]
+
+    def test_filters(self):
+        with self.subTest("Colour"):
+            self.assertEqual(self.ids(f'colour={RED}'), [self.red_cap.id, self.tshirt.id])
+        with self.subTest("Several values"):
+            self.assertEqual(self.ids(f'colour={RED},{BLUE}&category={CAPS}'), [self.red_cap.id, self.blue_cap.id])
+        with self.subTest("Size and fabric"):
+            self.assertEqual(self.ids(f'size={SIZE_M}&fabric={LYCRA}'), [self.tshirt.id])
+        with self.subTest("Brand"):
+            self.assertEqual(self.ids('brand=Adidas'), [self.blue_cap.id])
+        with self.subTest("Availability"):
+            self.assertEqual(self.ids('available=false'), [self.red_cap.id])
+        with self.subTest("Price range"):
+            self.assertEqual(self.ids('min_price=15&max_price=25'), [self.tshirt.id])
+
+    def test_invalid_values(self):
+        for query in (f'colour={WHITE},pink', 'available=maybe', 'min_price=cheap', 'ordering=brand'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/product/?{query}').status_code, 400)
+
+    def test_ordering_pages(self):
+        self.assertEqual(self.ids('ordering=price'), [self.red_cap.id, self.tshirt.id, self.blue_cap.id])
+
+        first = self.client.get('/product/?ordering=-price&page_size=2').json()
+        self.assertEqual([p['id'] for p in first['results']], [self.blue_cap.id, self.tshirt.id])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([p['id'] for p in second['results']], [self.red_cap.id])
+
+    def test_facets(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/product/?facets=true&colour={RED}')
+        facets = response.json()['facets']
+        self.assertEqual(facets['colour'], {RED: 2})
+        self.assertEqual(facets['brand'], {'Nike': 2})
+        self.assertEqual(facets['category'], {CAPS: 1, TSHIRTS: 1})
+        self.assertEqual(facets['available'], {'true': 1, 'false': 1})
+        self.assertNotIn('facets', self.client.get('/product/').json())
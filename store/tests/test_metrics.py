@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from ..metrics import metrics
+from .factories import ProductFactory
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        ProductFactory.create_batch(3)
+
+    def histogram(self, name, route, method='GET'):
+        return metrics.histograms[(name, (('route', route), ('method', method)))]
+
+    def test_records_requests_per_route(self):
+        self.client.get('/product/')
+        self.client.get('/product/')
+        self.client.get('/no-such-page/')
+
+        self.assertEqual(metrics.counters[('http_requests_total', (
+            ('route', 'product-list'), ('method', 'GET'), ('status', '200')))], 2)
+        self.assertEqual(metrics.counters[('http_requests_total', (
+            ('route', '<unresolved>'), ('method', 'GET'), ('status', '404')))], 1)
+        queries = self.histogram('db_queries_per_request', 'product-list')
+        self.assertEqual(sum(queries[:-1]), 2)
+        # The first request reads the database, the second one is served from the catalog cache.
+        self.assertGreater(queries[-1], 0)
+        self.assertEqual(sum(self.histogram('http_request_duration_seconds', 'product-list')[:-1]), 2)
+
+    def test_streaming_response_is_recorded_when_consumed(self):
+        route = 'store.views.CatalogExport'
+        response = self.client.get('/export/catalog.ndjson')
+        self.assertFalse([labels for _, labels in metrics.counters if ('route', route) in labels])
+        size = len(b''.join(response.streaming_content))
+
+        self.assertEqual(self.histogram('http_response_size_bytes', route)[-1], size)
+        self.assertEqual(self.histogram('db_queries_per_request', route)[-1], 1)
+
+    def test_exposition(self):
+        self.client.get('/product/')
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode('utf-8').splitlines()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn('http_requests_total{route="product-list",method="GET",status="200"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{route="product-list",method="GET",le="+Inf"} 1', lines)
+        self.assertIn('http_request_duration_seconds_count{route="product-list",method="GET"} 1', lines)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+        self.client.force_login(User.objects.create_user('customer'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_adds_up_worker_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            self.client.get('/product/')
+            metrics.flush()
+            with open(os.path.join(directory, f'{os.getpid()}.json')) as source:
+                snapshot = json.load(source)
+            # Another worker process that answered the same requests.
+            with open(os.path.join(directory, '1.json'), 'w') as output:
+                json.dump(snapshot, output)
+
+            lines = metrics.render().splitlines()
+        self.assertIn('http_requests_total{route="product-list",method="GET",status="200"} 2', lines)
+        self.assertIn('db_queries_per_request_count{route="product-list",method="GET"} 2', lines)
@@ -4,7 +4,7 @@ from rest_framework.exceptions import ValidationError
 
 from .factories import CategoryFactory, ProductFactory, CartFactory, CustomerFactory, CartItemFactory
 from ..constants import WHITE, BLACK, RED, SIZE_XS, COTTOM, SIZING_MALE, CAPS, TSHIRTS
-from ..models import CartItem
+from ..models import Cart, CartItem, StockMovement
 
 
 class CategoryTest(TestCase):
@@ -157,13 +157,34 @@ class CartTest(TestCase):
     def test_current_cart_created_and_not_completed(self):
         CartFactory(
             id='c167678d-702d-49fc-a84f-492d9bcbad98',
+            owner='session:abc',
             completed=False,
         )
         with self.assertRaises(ValidationError):
             CartFactory(
-                id='c167678d-702d-49fc-a84f-492d9bcbad98',
+                id='c167678d-702d-49fc-a84f-492d9bcbad99',
+                owner='session:abc',
             )
 
+    def test_active_carts_of_different_owners(self):
+        CartFactory(owner='session:abc', completed=False)
+        cart = CartFactory(owner='customer:1', completed=False)
+        self.assertFalse(cart.completed)
+        self.assertEqual(Cart.objects.filter(completed=False).count(), 2)
+
+    def test_save_keeps_the_totals(self):
+        cart = CartFactory()
+        loaded = Cart.objects.get(pk=cart.pk)
+        CartItemFactory(cart=cart, product=ProductFactory(price=10, current_stock=5), quantity=2)
+        loaded.owner = 'session:other'
+        loaded.save()
+        self.assertEqual(Cart.objects.values_list('owner', 'item_count', 'total_amount').get(pk=cart.pk),
+                         ('session:other', 2, 20))
+
+        response = self.client.patch(f'/carts/{cart.pk}/', {'completed': False}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Cart.objects.values_list('item_count', 'total_amount').get(pk=cart.pk), (2, 20))
+
 
 class CartItemTest(TestCase):
     def test_add_product_on_stock(self):
@@ -200,6 +221,20 @@ class CartItemTest(TestCase):
                 quantity=2,
             )
 
+    def test_deleted_product_leaves_the_carts(self):
+        open_cart, completed_cart = CartFactory(), CartFactory()
+        cap, visor = ProductFactory(price=10, current_stock=5), ProductFactory(price=3, current_stock=5)
+        CartItemFactory(cart=open_cart, product=cap, quantity=2)
+        CartItemFactory(cart=open_cart, product=visor, quantity=1)
+        CartItemFactory(cart=completed_cart, product=cap, quantity=1)
+        Cart.objects.filter(pk=completed_cart.pk).update(completed=True)
+
+        self.assertEqual(self.client.delete(f'/product/{cap.pk}/').status_code, 204)
+        self.assertEqual(Cart.objects.values_list('item_count', 'total_amount').get(pk=open_cart.pk), (1, 3))
+        self.assertEqual(Cart.objects.values_list('item_count', 'total_amount').get(pk=completed_cart.pk), (0, 0))
+        released = StockMovement.objects.filter(product_id=cap.pk, kind=StockMovement.RELEASE)
+        self.assertEqual(list(released.values_list('cart_ref', 'quantity')), [(open_cart.pk, 2)])
+
 
 class CustomerTest(TestCase):
     def test_create(self):
@@ -0,0 +1,121 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from freezegun import freeze_time
+from rest_framework.test import APITestCase
+
+from ..constants import CAPS
+from ..models import Cart, OutboxEmail
+from ..utils import purchase_summary, send_mail_customer
+from .factories import CategoryFactory, ProductFactory, CartFactory, CartItemFactory, CustomerFactory
+
+
+class CountingBackend(locmem.EmailBackend):
+    # Counts the connections opened and refuses mail to the addresses in `rejected`.
+    opened = 0
+    rejected = set()
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if any(address in self.rejected for message in messages for address in message.to):
+            raise ConnectionError("Mailbox unavailable")
+        return super().send_messages(messages)
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        caps = CategoryFactory(name=CAPS)
+        self.cart = CartFactory()
+        CartItemFactory(cart=self.cart, product=ProductFactory(category=caps, price=10, description='Cap'), quantity=2)
+        CartItemFactory(cart=self.cart, product=ProductFactory(category=caps, price=4.5, description='Visor'),
+                        quantity=1)
+        self.customer = self.make_customer(self.cart, 'buyer@example.com')
+
+    @staticmethod
+    def make_customer(cart, email):
+        return CustomerFactory(cart=cart, name='Ana', surname='Test', address='Street 1', email=email, phone='600')
+
+
+class PurchaseSummaryTest(OutboxTestCase):
+    def test_summary_covers_every_item(self):
+        with self.assertNumQueries(1):
+            summary = purchase_summary(self.cart.pk)
+        self.assertEqual(summary, "2 x Cap: 20.00€\n1 x Visor: 4.50€\n\nYou have made a purchase of 24.50€.")
+
+    def test_email_is_queued_with_the_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            send_mail_customer(self.customer)
+            raise RuntimeError
+        self.assertFalse(OutboxEmail.objects.exists())
+
+        email = send_mail_customer(self.customer)
+        self.assertEqual(send_mail_customer(self.customer), email)
+        self.assertEqual((email.to, email.status, email.cart_id), ('buyer@example.com', OutboxEmail.PENDING,
+                                                                 self.cart.pk))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class CompleteCartTest(APITestCase):
+    def test_completing_a_cart_queues_the_summary(self):
+        cart = CartFactory()
+        CartItemFactory(cart=cart, product=ProductFactory(price=10, description='Cap'), quantity=1)
+        OutboxTestCase.make_customer(cart, 'buyer@example.com')
+
+        response = self.client.patch(f'/carts/{cart.pk}/', {'completed': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(OutboxEmail.objects.values_list('cart_id', 'to')), [(cart.pk, 'buyer@example.com')])
+
+        self.client.patch(f'/carts/{cart.pk}/', {'completed': True}, format='json')
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+
+@override_settings(EMAIL_BACKEND='store.tests.test_outbox.CountingBackend', OUTBOX_MAX_ATTEMPTS=2,
+                   OUTBOX_BACKOFF_SECONDS=60)
+class SendOutboxTest(OutboxTestCase):
+    def setUp(self):
+        super().setUp()
+        CountingBackend.opened = 0
+        CountingBackend.rejected = {'bounce@example.com'}
+        for index in range(5):
+            cart = CartFactory()
+            Cart.objects.filter(pk=cart.pk).update(completed=True)
+            send_mail_customer(self.make_customer(cart, f'customer{index}@example.com'))
+        self.bounce = send_mail_customer(self.customer)
+        OutboxEmail.objects.filter(pk=self.bounce.pk).update(to='bounce@example.com')
+
+    def send_outbox(self):
+        out = StringIO()
+        call_command('send_outbox', '--batch-size=2', stdout=out)
+        return out.getvalue()
+
+    def test_batches_share_one_connection(self):
+        self.assertIn("Sent 5 emails, 1 failed.", self.send_outbox())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingBackend.opened, 2, "One connection, reopened once after the failure")
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 5)
+        self.assertIn("Sent 0 emails, 0 failed.", self.send_outbox())
+
+    def test_failures_are_retried_with_backoff(self):
+        started = timezone.now()
+        with freeze_time(started):
+            self.send_outbox()
+        self.bounce.refresh_from_db()
+        self.assertEqual((self.bounce.status, self.bounce.attempts), (OutboxEmail.PENDING, 1))
+        self.assertEqual(self.bounce.next_attempt, started + timedelta(seconds=60))
+        self.assertIn("ConnectionError: Mailbox unavailable", self.bounce.last_error)
+
+        with freeze_time(started + timedelta(seconds=30)):
+            self.assertIn("0 failed", self.send_outbox())
+        with freeze_time(started + timedelta(seconds=61)):
+            self.assertIn("1 failed", self.send_outbox())
+        self.bounce.refresh_from_db()
+        self.assertEqual((self.bounce.status, self.bounce.attempts), (OutboxEmail.FAILED, 2))
@@ -0,0 +1,63 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from ..constants import CAPS, TSHIRTS
+from .factories import CategoryFactory, ProductFactory, CustomerFactory
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        tshirts = CategoryFactory(name=TSHIRTS)
+        caps = CategoryFactory(name=CAPS)
+        ProductFactory.create_batch(3, category=caps)
+        ProductFactory.create_batch(4, category=tshirts)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            page = self.client.get(url).json()
+            ids.extend(product['id'] for product in page['results'])
+            url = page['next']
+        return ids
+
+    def test_pages_follow_composite_key(self):
+        ids = self.walk('/product/?page_size=2')
+        self.assertEqual(ids, [4, 5, 6, 7, 1, 2, 3])
+
+        first = self.client.get('/product/?page_size=3').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([product['id'] for product in second['results']], [7, 1, 2])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_no_count_or_offset(self):
+        first = self.client.get('/product/?page_size=2').json()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first['next'])
+        # The conditional GET validators read the same page as the response.
+        page_sql = [query['sql'].upper() for query in queries if 'LIMIT' in query['sql']]
+        self.assertEqual(len(page_sql), 2)
+        for sql in page_sql:
+            self.assertNotIn('COUNT(', sql)
+            self.assertNotIn('OFFSET', sql)
+
+    @override_settings(PAGINATION_MAX_PAGE_SIZE=5)
+    def test_page_size_cap(self):
+        with self.subTest("Capped"):
+            response = self.client.get('/product/?page_size=100').json()
+            self.assertEqual(len(response['results']), 5)
+
+        with self.subTest("Default"):
+            CustomerFactory.create_batch(
+                3, name="John", surname="Smith", address="Consell", email="jvn@gmail.com", phone="1",
+            )
+            response = self.client.get('/customers/').json()
+            self.assertEqual(len(response['results']), 3)
+            self.assertIsNone(response['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/product/?cursor=bad')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,76 @@
+import datetime
+import decimal
+import uuid
+from collections import OrderedDict
+from unittest import mock, skipIf, skipUnless
+
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from .. import renderers
+from ..renderers import FastJSONRenderer, MessagePackRenderer
+from .factories import CartFactory, CartItemFactory, ProductFactory
+
+PAYLOAD = [
+    OrderedDict([
+        ('id', uuid.UUID('c167678d-702d-49fc-a84f-492d9bcbad87')),
+        ('created', datetime.datetime(2023, 12, 1, 10, 30, 0, 123456)),
+        ('updated', datetime.datetime(2023, 12, 1, 10, 30, tzinfo=datetime.timezone.utc)),
+        ('total', decimal.Decimal('96.30')),
+        ('ratio', 0.1),
+        ('items', [{'description': 'Gorra "ñandú" €', 'quantity': 2, 'available': True, 'size': None}]),
+        ('facets', {True: 1}),
+    ]),
+]
+
+
+def unpack(content):
+    if renderers.ormsgpack is not None:
+        return renderers.ormsgpack.unpackb(content)
+    return renderers.msgpack.unpackb(content)
+
+
+class FastJSONRendererTest(SimpleTestCase):
+    @skipIf(renderers.orjson is None, "orjson is not installed")
+    def test_same_bytes_as_drf(self):
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD), JSONRenderer().render(PAYLOAD))
+
+    def test_decimal(self):
+        with mock.patch.object(renderers, 'drf_default') as drf_default:
+            self.assertEqual(renderers.encode_default(decimal.Decimal('96.30')), 96.3)
+        drf_default.assert_not_called()
+        self.assertEqual(FastJSONRenderer().render({'total': decimal.Decimal('96.30')}), b'{"total":96.3}')
+
+    def test_fallbacks(self):
+        expected = JSONRenderer().render(PAYLOAD)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(PAYLOAD), expected)
+        self.assertEqual(FastJSONRenderer().render({'n': 2 ** 70}), JSONRenderer().render({'n': 2 ** 70}))
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD, 'application/json; indent=2'),
+                         JSONRenderer().render(PAYLOAD, 'application/json; indent=2'))
+
+
+@skipUnless(MessagePackRenderer.available, "no MessagePack package is installed")
+class MessagePackTest(APITestCase):
+    def test_same_values_as_json(self):
+        # MessagePack keeps non-string keys as they are, so only string keys are compared with JSON.
+        payload = [OrderedDict((key, value) for key, value in PAYLOAD[0].items() if key != 'facets')]
+        expected = JSONRenderer().render(payload)
+        self.assertEqual(JSONRenderer().render(unpack(MessagePackRenderer().render(payload))), expected)
+        if renderers.ormsgpack is not None and renderers.msgpack is not None:
+            with mock.patch.object(renderers, 'ormsgpack', None):
+                content = MessagePackRenderer().render(payload)
+            self.assertEqual(JSONRenderer().render(renderers.msgpack.unpackb(content)), expected)
+
+    def test_accept_negotiation(self):
+        cart = CartFactory()
+        CartItemFactory(cart=cart, product=ProductFactory(price=10), quantity=2)
+
+        response = self.client.get(f'/carts/{cart.pk}/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(unpack(response.content), self.client.get(f'/carts/{cart.pk}/').json())
+
+        with mock.patch.object(MessagePackRenderer, 'available', False):
+            response = self.client.get(f'/carts/{cart.pk}/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 406)
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+
+from ..cache import catalog_cache
+from ..constants import CAPS, TSHIRTS
+from ..models import Category, Product
+from ..routers import ReplicaRouter, read_from_replicas, routing
+from .factories import CategoryFactory, ProductFactory
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TransactionTestCase):
+    """
+    The replica is a second SQLite file, which only sees the primary's rows when replicate()
+    runs. It is added after the test database setup, so the test runner does not create it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        connections.databases['replica'] = dict(connections['default'].settings_dict,
+                                                NAME=os.path.join(cls.directory, 'replica.sqlite3'))
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def setUp(self):
+        catalog_cache.cache.clear()
+        self.caps = CategoryFactory(name=CAPS)
+        self.cap = ProductFactory(category=self.caps, description="Replicated cap")
+        self.replicate()
+
+    def replicate(self):
+        for model in (Product, Category):
+            model.objects.using('replica').all().delete()
+        for model in (Category, Product):
+            model.objects.using('replica').bulk_create(model.objects.using('default').order_by('pk'))
+
+    def descriptions(self, response):
+        return [product['description'] for product in response.json()['results']]
+
+    def test_catalog_reads_lag_behind_on_the_replica(self):
+        ProductFactory(category=self.caps, description="Fresh cap")
+
+        self.assertEqual(self.descriptions(self.client.get('/product/')), ["Replicated cap"])
+        self.assertEqual(self.client.get(f'/product/{self.cap.pk + 1}/').status_code, 404)
+
+        self.replicate()
+        catalog_cache.cache.clear()
+        self.assertEqual(self.descriptions(self.client.get('/product/')), ["Replicated cap", "Fresh cap"])
+
+    def test_reads_after_a_write_use_the_primary(self):
+        response = self.client.post('/category/', {'name': TSHIRTS})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('primary_pin', response.cookies)
+
+        # The same client reads its write; another client still sees the lagging replica.
+        self.assertEqual(len(self.client.get('/category/').json()['results']), 2)
+        self.client.cookies.clear()
+        self.assertEqual(len(self.client.get('/category/').json()['results']), 1)
+
+    def test_other_reads_use_the_primary(self):
+        Product.objects.filter(pk=self.cap.pk).update(description="Renamed cap")
+        self.assertEqual(self.client.get(f'/product/{self.cap.pk}/update').json()['description'], "Renamed cap")
+        self.assertEqual(self.client.get(f'/product/{self.cap.pk}/').json()['description'], "Replicated cap")
+
+    def test_write_pins_the_rest_of_the_request(self):
+        router = ReplicaRouter()
+        with routing():
+            self.assertEqual(router.db_for_read(Product), 'default')
+            read_from_replicas()
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            self.assertEqual(router.db_for_write(Product), 'default')
+            self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertEqual(router.db_for_read(Product), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        ProductFactory(category=self.caps, description="Fresh cap")
+        self.assertEqual(self.descriptions(self.client.get('/product/')), ["Replicated cap", "Fresh cap"])
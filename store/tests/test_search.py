@@ -0,0 +1,58 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from rest_framework.test import APITestCase
+
+from ..constants import CAPS
+from ..search import FTS_TABLE, match_expression
+from .factories import CategoryFactory, ProductFactory
+
+
+class ProductSearchTest(APITestCase):
+    def setUp(self):
+        caps = CategoryFactory(name=CAPS)
+        self.nike = ProductFactory(category=caps, brand="Nike", description="Black trucker cap")
+        self.adidas = ProductFactory(category=caps, brand="Adidas", description="Red cap with Nike logo")
+        self.puma = ProductFactory(category=caps, brand="Puma", description="Green beanie")
+
+    def search(self, query):
+        response = self.client.get('/product/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.json()['results']]
+
+    def test_match_expression(self):
+        self.assertEqual(match_expression('nik "cap'), '"nik"* AND "cap"*')
+        self.assertIsNone(match_expression('  '))
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.search('nik'), [self.nike.id, self.adidas.id])
+        self.assertEqual(self.search('nike red'), [self.adidas.id])
+        self.assertEqual(self.search('bean'), [self.puma.id])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_products(self):
+        with self.subTest("Updated"):
+            self.puma.description = "Green cap"
+            self.puma.save()
+            self.assertIn(self.puma.id, self.search('cap'))
+            self.assertEqual(self.search('beanie'), [])
+
+        with self.subTest("Deleted"):
+            self.nike.delete()
+            self.assertEqual(self.search('trucker'), [])
+
+    def test_results_use_product_serializer(self):
+        response = self.client.get('/product/search/', {'q': 'puma'}).json()
+        self.assertEqual(response['results'][0]['category_name'], 'caps')
+        self.assertEqual(response['results'][0]['brand'], 'Puma')
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        self.assertEqual(self.search('nike'), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', '--batch-size=2', stdout=out)
+        self.assertIn("Indexed 3 products", out.getvalue())
+        self.assertEqual(self.search('nike'), [self.nike.id, self.adidas.id])
@@ -1,8 +1,11 @@
 from freezegun import freeze_time
 from django.test import TestCase
 from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 
 from ..constants import CAPS, TSHIRTS
+from ..fast import compile_serializer
+from ..models import Product
 from ..serializers import CategorySerializer, ProductSerializer, CartSerializer, TShirtSerializer, CartItemSerializer, \
     CapSerializer, SimpleProductSerializer, AddCartItemSerializer
 from .factories import CategoryFactory, ProductFactory, CartFactory, CartItemFactory
@@ -218,6 +221,7 @@ class CartSerializerTest(TestCase):
             quantity=3,
         )
 
+        cart.refresh_from_db()
         output = CartSerializer(cart).data
         self.assertEqual(output['id'], 'c167678d-702d-49fc-a84f-492d9bcbad87')
         self.assertEqual(
@@ -225,7 +229,9 @@ class CartSerializerTest(TestCase):
             {
                 'product__id': 1,
                 'product__description': 'Product test',
-                'product__price': 20.4
+                'product__price': 20.4,
+                'quantity': 2,
+                'sub_total': 40.8,
             },
         )
         self.assertEqual(
@@ -233,9 +239,34 @@ class CartSerializerTest(TestCase):
             {
                 'product__id': 2,
                 'product__description': 'Product test',
-                'product__price': 18.5
+                'product__price': 18.5,
+                'quantity': 3,
+                'sub_total': 55.5,
             },
         )
-        self.assertEqual(output['total'], 38.9)
+        self.assertEqual(output['item_count'], 5)
+        self.assertAlmostEqual(output['total'], 96.3)
         self.assertEqual(output['created'], '2023-12-01T00:00:00')
         self.assertFalse(output['completed'])
+
+
+class CompiledSerializerTest(TestCase):
+    def setUp(self):
+        ProductFactory(category=CategoryFactory(name=CAPS), logo_colour=None, price=12.5, current_stock=0)
+        tshirts = CategoryFactory(name=TSHIRTS)
+        ProductFactory(category=tshirts, size=None, sleeve=None, description='Ünïcode "tee"')
+        ProductFactory(category=tshirts, price=1e-7, current_stock=3)
+
+    def test_output_is_byte_identical(self):
+        queryset = Product.objects.order_by('pk')
+        for serializer_class in (ProductSerializer, CapSerializer, TShirtSerializer, SimpleProductSerializer):
+            with self.subTest(serializer_class.__name__):
+                compiled = compile_serializer(serializer_class)
+                with self.assertNumQueries(1):
+                    output = compiled.data(compiled.rows(queryset))
+                self.assertEqual(JSONRenderer().render(output),
+                                 JSONRenderer().render(serializer_class(queryset, many=True).data))
+
+    def test_nested_serializers_are_not_compiled(self):
+        self.assertIsNone(compile_serializer(CartItemSerializer))
+        self.assertIsNone(compile_serializer(CartSerializer))
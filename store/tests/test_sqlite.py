@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Category
+from ..sqlite import immediate
+from ..sqlite.base import DatabaseWrapper
+
+
+class PragmaTest(SimpleTestCase):
+    def test_pragmas_on_every_connection(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'store.sqlite3'))
+            wrapper = DatabaseWrapper(settings_dict, alias='pragmas')
+            try:
+                with wrapper.cursor() as cursor:
+                    values = {}
+                    for name in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout'):
+                        cursor.execute(f'PRAGMA {name}')
+                        values[name] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        self.assertEqual(values, {'journal_mode': 'wal', 'synchronous': 1, 'mmap_size': 268435456,
+                                  'cache_size': -65536, 'busy_timeout': 5000})
+
+
+class ImmediateTest(TransactionTestCase):
+    def begins(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+
+    def test_outermost_transaction_begins_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with immediate():
+                Category.objects.create(name='Cap')
+                with immediate():
+                    Category.objects.create(name='Cap')
+            with transaction.atomic():
+                Category.objects.create(name='Cap')
+        self.assertEqual(self.begins(queries), ['BEGIN IMMEDIATE', 'BEGIN'])
+        self.assertEqual(Category.objects.count(), 3)
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError), immediate():
+            Category.objects.create(name='Cap')
+            raise ValueError
+        self.assertFalse(Category.objects.exists())
+        self.assertFalse(connection.begin_immediate)
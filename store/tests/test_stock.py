@@ -0,0 +1,287 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from ..constants import CAPS
+from ..models import Cart, Customer, Product, StockMovement, StockShard
+from ..stock import available_stock, compact_stock, reserve_stock, release_stock, restock, set_stock_shards
+from ..sweeper import sweep_chunk
+from .factories import CategoryFactory, ProductFactory, CartFactory, CartItemFactory, CustomerFactory
+
+
+class ReserveStockTest(TestCase):
+    def setUp(self):
+        self.cap = ProductFactory(category=CategoryFactory(name=CAPS), current_stock=5)
+
+    def test_reserve_and_release(self):
+        reserve_stock(self.cap.id, 3)
+        self.assertEqual(available_stock(self.cap.id), 2)
+
+        release_stock(self.cap.id, 1)
+        self.assertEqual(available_stock(self.cap.id), 3)
+
+    def test_reserve_more_than_stock(self):
+        with self.assertRaises(ValidationError):
+            reserve_stock(self.cap.id, 6)
+        self.assertEqual(available_stock(self.cap.id), 5)
+
+    def test_cart_item_changes_move_stock(self):
+        cart_item = CartItemFactory(cart=CartFactory(), product=self.cap, quantity=2)
+        self.assertEqual(available_stock(self.cap.id), 3)
+
+        with self.subTest("Quantity grows"):
+            cart_item.quantity = 4
+            cart_item.save()
+            self.assertEqual(available_stock(self.cap.id), 1)
+
+        with self.subTest("Quantity shrinks"):
+            cart_item.quantity = 1
+            cart_item.save()
+            self.assertEqual(available_stock(self.cap.id), 4)
+
+        with self.subTest("Item removed"):
+            cart_item.delete()
+            self.assertEqual(available_stock(self.cap.id), 5)
+
+    def test_deleted_cart_gives_stock_back(self):
+        open_cart, completed_cart = CartFactory(), CartFactory()
+        CartItemFactory(cart=open_cart, product=self.cap, quantity=4)
+        CartItemFactory(cart=completed_cart, product=self.cap, quantity=1)
+        Cart.objects.filter(pk=completed_cart.pk).update(completed=True)
+        self.assertEqual(available_stock(self.cap.id), 0)
+
+        self.assertEqual(self.client.delete(f'/carts/{open_cart.pk}/').status_code, 204)
+        self.assertEqual(available_stock(self.cap.id), 4)
+        Cart.objects.get(pk=completed_cart.pk).delete()
+        self.assertEqual(available_stock(self.cap.id), 4)
+
+
+class StockLedgerTest(TestCase):
+    def setUp(self):
+        self.cap = ProductFactory(category=CategoryFactory(name=CAPS), initial_stock=10, current_stock=10)
+        self.cart = CartFactory()
+
+    def ledger(self):
+        return list(StockMovement.objects.filter(product=self.cap).order_by('pk').values_list(
+            'kind', 'quantity', 'cart_ref', 'compacted'))
+
+    def test_movements_are_inserted(self):
+        cart_item = CartItemFactory(cart=self.cart, product=self.cap, quantity=3)
+        cart_item.quantity = 1
+        cart_item.save()
+        self.assertEqual(StockMovement.objects.filter(item_ref=cart_item.pk).count(), 2)
+        self.assertEqual(self.ledger(), [
+            (StockMovement.RESERVE, -3, self.cart.pk, False),
+            (StockMovement.RELEASE, 2, self.cart.pk, False),
+        ])
+        self.cap.refresh_from_db()
+        self.assertEqual((self.cap.current_stock, available_stock(self.cap.id)), (10, 9))
+
+    def test_stock_in_one_query(self):
+        reserve_stock(self.cap.id, 4)
+        with self.assertNumQueries(1):
+            self.assertEqual(Product.objects.with_stock().get(pk=self.cap.pk).stock, 6)
+        plan = str(Product.objects.with_stock().filter(pk=self.cap.pk).values('stock').explain())
+        self.assertIn('stock_movement_pending_idx', plan)
+
+    def test_compaction(self):
+        reserve_stock(self.cap.id, 4)
+        release_stock(self.cap.id, 1)
+        loaded = Product.objects.get(pk=self.cap.pk)
+
+        self.assertEqual(compact_stock(batch_size=1), 2)
+        self.cap.refresh_from_db()
+        self.assertEqual((self.cap.current_stock, available_stock(self.cap.id)), (7, 7))
+        self.assertFalse(StockMovement.objects.filter(compacted=False).exists())
+
+        with self.subTest("Saving a loaded product keeps the snapshot"):
+            loaded.brand = 'Nike'
+            loaded.save()
+            self.assertEqual(available_stock(self.cap.id), 7)
+
+    def test_stock_counts_are_adjustments(self):
+        self.assertEqual(ProductFactory(initial_stock=4, current_stock=8).stock_movements.get().quantity, 4)
+
+        reserve_stock(self.cap.id, 2)
+        self.cap.current_stock = 20
+        self.cap.save()
+        self.assertEqual(available_stock(self.cap.id), 18)
+        # The ledger opens at initial_stock.
+        self.assertEqual(self.cap.initial_stock + sum(quantity for _, quantity, _, _ in self.ledger()), 18)
+
+    def test_completed_cart_is_sold(self):
+        CartItemFactory(cart=self.cart, product=self.cap, quantity=2)
+        response = self.client.patch(f'/carts/{self.cart.pk}/', {'completed': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([kind for kind, _, _, _ in self.ledger()],
+                         [StockMovement.RESERVE, StockMovement.RELEASE, StockMovement.SELL])
+        self.assertEqual(available_stock(self.cap.id), 8)
+
+
+class StockShardTest(TestCase):
+    def setUp(self):
+        self.cap = ProductFactory(category=CategoryFactory(name=CAPS), initial_stock=10, current_stock=10)
+        reserve_stock(self.cap.id, 1)
+        set_stock_shards(self.cap.id, 4)
+
+    def shards(self):
+        return list(StockShard.objects.filter(product=self.cap).order_by('shard').values_list('stock', flat=True))
+
+    def test_stock_is_spread(self):
+        self.assertEqual(self.shards(), [3, 2, 2, 2])
+        self.assertEqual(available_stock(self.cap.id), 9)
+        self.assertTrue(Product.objects.with_stock().get(pk=self.cap.pk).is_available)
+
+    def test_reserve_takes_from_one_shard(self):
+        with self.assertNumQueries(6) as context:
+            reserve_stock(self.cap.id, 2)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "store_stockshard"') for query in context), 1)
+        self.assertIn(sorted(self.shards()), ([1, 2, 2, 2], [0, 2, 2, 3]))
+        self.assertEqual(available_stock(self.cap.id), 7)
+
+    def test_drained_shards_are_rebalanced(self):
+        reserve_stock(self.cap.id, 7)
+        self.assertEqual(self.shards(), [1, 1, 0, 0])
+        self.assertEqual(available_stock(self.cap.id), 2)
+        with self.assertRaises(ValidationError):
+            reserve_stock(self.cap.id, 3)
+        reserve_stock(self.cap.id, 2)
+        self.assertFalse(Product.objects.with_stock().get(pk=self.cap.pk).is_available)
+
+    def test_units_back_to_the_emptiest_shard(self):
+        reserve_stock(self.cap.id, 3)
+        release_stock(self.cap.id, 2)
+        restock(self.cap.id, 5)
+        self.assertEqual(sum(self.shards()), 13)
+        self.assertEqual(available_stock(self.cap.id), 13)
+
+    def test_compaction_and_counts(self):
+        CartItemFactory(cart=CartFactory(), product=self.cap, quantity=2)
+        compact_stock()
+        self.cap.refresh_from_db()
+        self.assertEqual((self.cap.current_stock, sum(self.shards())), (7, 7))
+
+        self.cap.current_stock = 20
+        self.cap.save()
+        self.assertEqual(self.shards(), [5, 5, 5, 5])
+        self.assertEqual(available_stock(self.cap.id), 20)
+
+    def test_api_reads_the_shards(self):
+        # Cached and validated before the reservation, which must not leave either stale.
+        before = {path: self.client.get(path)['ETag'] for path in (f'/product/{self.cap.pk}/', '/product/?facets=true')}
+        reserve_stock(self.cap.id, 9)
+        self.assertEqual(Product.objects.get(pk=self.cap.pk).current_stock, 10)
+        for path, etag in before.items():
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        detail = self.client.get(f'/product/{self.cap.pk}/').json()
+        self.assertEqual((detail['current_stock'], detail['product_available']), (0, False))
+        listed = self.client.get('/product/?facets=true').json()
+        self.assertEqual([(product['current_stock'], product['product_available']) for product in listed['results']],
+                         [(0, False)])
+        self.assertEqual(listed['facets']['available'], {'false': 1})
+        self.assertEqual(self.client.get('/product/?available=true').json()['results'], [])
+        self.assertEqual(len(self.client.get('/product/?available=false').json()['results']), 1)
+
+    def test_turned_off(self):
+        reserve_stock(self.cap.id, 2)
+        set_stock_shards(self.cap.id, 0)
+        self.assertEqual(self.shards(), [])
+        self.assertEqual(available_stock(self.cap.id), 7)
+        reserve_stock(self.cap.id, 7)
+        self.assertEqual(available_stock(self.cap.id), 0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('stock_shards', str(self.cap.id), '2', stdout=out)
+        self.assertIn("has 2 stock shards", out.getvalue())
+        self.assertEqual(self.shards(), [5, 4])
+
+
+class ReserveStockConcurrencyTest(TransactionTestCase):
+    threads = 8
+    attempts = 25
+    stock = 120
+
+    def test_hot_product(self):
+        product_id = ProductFactory(category=CategoryFactory(name=CAPS), current_stock=self.stock).id
+        reserved = []
+        lock = threading.Lock()
+
+        def buyer():
+            try:
+                for _ in range(self.attempts):
+                    while True:
+                        try:
+                            reserve_stock(product_id, 1)
+                        except ValidationError:
+                            break
+                        except OperationalError:
+                            # SQLite reports lock contention instead of waiting; try again.
+                            continue
+                        with lock:
+                            reserved.append(1)
+                        break
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buyer) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        current_stock = available_stock(product_id)
+        self.assertGreaterEqual(current_stock, 0)
+        self.assertEqual(len(reserved), self.stock)
+        self.assertEqual(current_stock, self.stock - len(reserved))
+
+
+@override_settings(CART_TTL_SECONDS=3600)
+class SweepCartsTest(TestCase):
+    def setUp(self):
+        category = CategoryFactory(name=CAPS)
+        self.cap, self.hat = ProductFactory(category=category, current_stock=10), ProductFactory(
+            category=category, current_stock=10)
+
+    def cart(self, items, age, completed=False):
+        cart = CartFactory()
+        for product, quantity in items:
+            CartItemFactory(cart=cart, product=product, quantity=quantity)
+        then = timezone.now() - timedelta(seconds=age)
+        Cart.objects.filter(pk=cart.pk).update(created=then, updated=then, completed=completed)
+        return cart
+
+    def assertStock(self, cap, hat):
+        self.assertEqual((available_stock(self.cap.id), available_stock(self.hat.id)), (cap, hat))
+
+    def test_expired_carts_give_their_stock_back(self):
+        abandoned = self.cart([(self.cap, 2), (self.hat, 3)], age=7200)
+        customer = CustomerFactory(cart=abandoned)
+        self.cart([(self.cap, 1)], age=7200)
+        fresh = self.cart([(self.cap, 1)], age=60)
+        completed = self.cart([(self.hat, 1)], age=7200, completed=True)
+        self.assertStock(6, 6)
+
+        out = StringIO()
+        call_command('sweep_carts', '--batch-size=1', stdout=out)
+        self.assertIn("Swept 2 expired carts.", out.getvalue())
+        self.assertStock(9, 9)
+        self.assertCountEqual(Cart.objects.values_list('pk', flat=True), [fresh.pk, completed.pk])
+        self.assertIsNone(Customer.objects.get(pk=customer.pk).cart)
+
+    def test_one_stock_insert_per_chunk(self):
+        for _ in range(3):
+            self.cart([(self.cap, 1), (self.hat, 1)], age=7200)
+        with self.assertNumQueries(13) as context:
+            self.assertEqual(sweep_chunk(10, timezone.now()), 3)
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "store_stockmovement"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertStock(10, 10)
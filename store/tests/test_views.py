@@ -0,0 +1,320 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from ..constants import CAPS, TSHIRTS
+from ..models import Cart, CartItem, OutboxEmail, Product, StockMovement
+from ..serializers import CartItemSerializer, ProductSerializer, plan_queryset
+from ..stock import available_stock, release_stock, reserve_stock
+from .factories import CategoryFactory, ProductFactory, CartFactory, CartItemFactory, CustomerFactory
+
+
+class QueryPlanTest(APITestCase):
+    def setUp(self):
+        self.caps = CategoryFactory(name=CAPS)
+        self.tshirts = CategoryFactory(name=TSHIRTS)
+
+    def test_product_list_query_count(self):
+        ProductFactory.create_batch(2, category=self.caps)
+        with self.assertNumQueries(2):
+            response = self.client.get('/product/')
+        self.assertEqual(len(response.json()['results']), 2)
+
+        ProductFactory.create_batch(20, category=self.tshirts)
+        with self.assertNumQueries(2):
+            response = self.client.get('/product/')
+        self.assertEqual(len(response.json()['results']), 22)
+
+    def test_nested_serializer_query_count(self):
+        cart = CartFactory()
+        for _ in range(5):
+            CartItemFactory(cart=cart, product=ProductFactory(category=self.caps, price=10), quantity=1)
+
+        with self.assertNumQueries(1):
+            output = CartItemSerializer(plan_queryset(CartItem.objects.all(), CartItemSerializer), many=True).data
+        self.assertEqual(output, CartItemSerializer(CartItem.objects.all(), many=True).data)
+        self.assertEqual(output[0]['product']['category_name'], 'caps')
+
+    def test_plan_loads_only_serialized_columns(self):
+        queryset = plan_queryset(Product.objects.all(), ProductSerializer)
+        self.assertEqual(queryset.query.select_related, {'category': {}})
+        self.assertNotIn('initial_stock', queryset.query.deferred_loading[0])
+        self.assertIn('category__name', queryset.query.deferred_loading[0])
+
+
+class CompiledListTest(APITestCase):
+    def test_pages_match_the_serializer(self):
+        caps = CategoryFactory(name=CAPS)
+        for price in (5, 12, 12, 30, 8):
+            ProductFactory(category=caps, price=price)
+
+        response = self.client.get('/product/?ordering=-price&page_size=3')
+        products = list(Product.objects.order_by('-price', '-id'))
+        self.assertEqual(JSONRenderer().render(response.data['results']),
+                         JSONRenderer().render(ProductSerializer(products[:3], many=True).data))
+        response = self.client.get(response.data['next'])
+        self.assertEqual(JSONRenderer().render(response.data['results']),
+                         JSONRenderer().render(ProductSerializer(products[3:], many=True).data))
+
+
+class CartViewSetTest(APITestCase):
+    def test_create_cart_per_session(self):
+        response = self.client.post('/carts/', {})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post('/carts/', {}).status_code, 400)
+
+        self.client.cookies.clear()
+        self.assertEqual(self.client.post('/carts/', {}).status_code, 201)
+
+    def test_list_query_count(self):
+        category = CategoryFactory(name=CAPS)
+        for price in (10, 20, 30):
+            cart = CartFactory()
+            for _ in range(3):
+                CartItemFactory(cart=cart, product=ProductFactory(category=category, price=price), quantity=2)
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/carts/')
+        carts = response.json()['results']
+        self.assertEqual([cart['total'] for cart in carts], [60, 120, 180])
+        self.assertEqual(carts[0]['items'][0]['sub_total'], 20)
+
+        CartItemFactory(cart=CartFactory(), product=ProductFactory(category=category, price=5), quantity=1)
+        with self.assertNumQueries(3):
+            response = self.client.get('/carts/')
+        self.assertEqual(len(response.json()['results']), 4)
+
+
+class CheckoutTest(APITestCase):
+    def setUp(self):
+        self.category = CategoryFactory(name=CAPS)
+
+    def cart(self, lines):
+        cart = CartFactory()
+        CustomerFactory(cart=cart, email='buyer@example.com')
+        products = [ProductFactory(category=self.category, price=2, initial_stock=10, current_stock=10)
+                    for _ in range(lines)]
+        for product in products:
+            CartItemFactory(cart=cart, product=product, quantity=3)
+        return cart, products
+
+    def checkout(self, cart):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(f'/carts/{cart.pk}/checkout/')
+        return response, len(context)
+
+    def test_checkout(self):
+        small, _ = self.cart(5)
+        cart, products = self.cart(50)
+        response, queries = self.checkout(cart)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['completed'])
+        self.assertEqual(response.json()['total'], 300)
+        self.assertEqual(self.checkout(small)[1], queries)
+
+        self.assertTrue(Cart.objects.get(pk=cart.pk).completed)
+        self.assertEqual(OutboxEmail.objects.filter(cart_id=cart.pk).count(), 1)
+        product = Product.objects.get(pk=products[0].pk)
+        self.assertEqual((product.current_stock, available_stock(product.pk)), (7, 7))
+        self.assertFalse(StockMovement.objects.filter(cart_ref=cart.pk, compacted=False).exists())
+        self.assertEqual(StockMovement.objects.filter(cart_ref=cart.pk, kind=StockMovement.SELL).count(), 50)
+
+    def test_lines_are_checked_against_stock(self):
+        cart, products = self.cart(2)
+        # A line from before the ledger: nothing reserved it.
+        StockMovement.objects.filter(cart_ref=cart.pk, product=products[0]).delete()
+        Product.objects.filter(pk=products[0].pk).update(current_stock=2)
+
+        response, _ = self.checkout(cart)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("there are 2 of this product", response.json()[0])
+        self.assertFalse(Cart.objects.get(pk=cart.pk).completed)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+        Product.objects.filter(pk=products[0].pk).update(current_stock=3)
+        self.assertEqual(self.checkout(cart)[0].status_code, 200)
+        self.assertEqual(available_stock(products[0].pk), 0)
+        self.assertEqual(available_stock(products[1].pk), 7)
+
+    def test_completed_cart_stays_completed(self):
+        cart, products = self.cart(1)
+        self.assertEqual(self.checkout(cart)[0].status_code, 200)
+        for path in (f'/carts/{cart.pk}/', f'/cart/{cart.pk}/update'):
+            with self.subTest(path=path):
+                response = self.client.patch(path, {'completed': False})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('completed', response.json())
+        self.assertTrue(Cart.objects.get(pk=cart.pk).completed)
+
+        self.assertEqual(self.client.delete(f'/carts/{cart.pk}/').status_code, 204)
+        self.assertEqual(available_stock(products[0].pk), 7)
+
+    def test_invalid_carts(self):
+        cart, _ = self.cart(1)
+        self.assertEqual(self.checkout(cart)[0].status_code, 200)
+        self.assertEqual(self.checkout(cart)[0].status_code, 400)
+        self.assertEqual(self.checkout(CartFactory())[0].status_code, 400)
+        self.assertEqual(self.client.post('/carts/not-a-cart/checkout/').status_code, 404)
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        self.category = CategoryFactory(name=CAPS)
+        self.cap = ProductFactory(category=self.category)
+
+    def test_product_list(self):
+        response = self.client.get('/product/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.subTest("Unchanged"):
+            with self.assertNumQueries(1):
+                response = self.client.get('/product/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+        with self.subTest("If-Modified-Since"):
+            response = self.client.get('/product/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304)
+
+        with self.subTest("Product added"):
+            ProductFactory(category=self.category)
+            response = self.client.get('/product/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_list_page(self):
+        others = ProductFactory.create_batch(2, category=self.category)
+        last = max([self.cap] + others, key=lambda product: product.pk)
+        etag = self.client.get('/product/?page_size=1')['ETag']
+
+        with self.subTest("Later page changed"):
+            self.client.patch(f'/product/{last.id}/', {'brand': 'Nike'})
+            self.assertEqual(self.client.get('/product/?page_size=1', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.subTest("Row replaced"):
+            first = min([self.cap] + others, key=lambda product: product.pk)
+            Product.objects.filter(pk=first.pk).delete()
+            self.assertEqual(self.client.get('/product/?page_size=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_stock_movements(self):
+        detail, listing = f'/product/{self.cap.id}/', '/product/'
+        for move, delta in ((reserve_stock, -2), (release_stock, 1)):
+            responses = {path: self.client.get(path) for path in (detail, listing)}
+            move(self.cap.pk, abs(delta))
+            for path, response in responses.items():
+                with self.subTest(move.__name__, path=path):
+                    self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+            self.assertEqual(self.client.get(detail).json()['current_stock'],
+                             responses[detail].json()['current_stock'] + delta)
+            self.assertEqual(self.client.get(listing).json()['results'][0]['current_stock'],
+                             responses[listing].json()['results'][0]['current_stock'] + delta)
+
+    def test_product_detail(self):
+        etag = self.client.get(f'/product/{self.cap.id}/')['ETag']
+        self.assertEqual(self.client.get(f'/product/{self.cap.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        CategoryFactory(name=TSHIRTS)
+        self.assertEqual(self.client.get(f'/product/{self.cap.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.patch(f'/product/{self.cap.id}/', {'brand': 'Nike'})
+        self.assertEqual(self.client.get(f'/product/{self.cap.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cart_list_page(self):
+        first, second = CartFactory(), CartFactory()
+        CartItemFactory(cart=first, product=self.cap, quantity=1)
+        CartItemFactory(cart=first, product=ProductFactory(category=self.category), quantity=1)
+        response = self.client.get('/carts/?page_size=1')
+        self.assertEqual(response.json()['results'][0]['id'], str(first.pk))
+        self.assertIsNotNone(response.json()['next'])
+
+        Cart.objects.filter(pk=second.pk).delete()
+        response = self.client.get('/carts/?page_size=1', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['next'])
+
+    def test_cart_detail(self):
+        cart = CartFactory()
+        etag = self.client.get(f'/carts/{cart.id}/')['ETag']
+        self.assertEqual(self.client.get(f'/carts/{cart.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        CartItemFactory(cart=cart, product=self.cap, quantity=1)
+        response = self.client.get(f'/carts/{cart.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['item_count'], 1)
+
+
+class ProductBatchTest(APITestCase):
+    def setUp(self):
+        self.caps = CategoryFactory(name=CAPS)
+        self.cap, self.other = ProductFactory.create_batch(2, category=self.caps, price=10)
+
+    def new_product(self, **fields):
+        data = {'category': self.caps.pk, 'main_colour': 'black', 'second_colour': 'white', 'brand': 'Nike',
+                'url_img': 'https://img.example.com/cap.jpg', 'price': 12, 'current_stock': 5,
+                'description': 'New cap'}
+        data.update(fields)
+        return data
+
+    def test_batch(self):
+        batch = {
+            'create': [self.new_product(), self.new_product(description='Second cap')],
+            'update': [{'id': self.cap.pk, 'price': 15}],
+            'delete': [self.other.pk],
+        }
+        cart = CartFactory()
+        CartItemFactory(cart=cart, product=self.cap, quantity=1)
+        CartItemFactory(cart=cart, product=self.other, quantity=2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/product/batch/', batch, format='json')
+        self.assertEqual(response.status_code, 200)
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT INTO "store_product"', 'UPDATE "store_product"'))]
+        self.assertEqual(len(writes), 2, "One INSERT for the creates and one UPDATE for the updates")
+        created = response.data['create']
+        self.assertEqual([result['status'] for result in created], [201, 201])
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[result['data']['id'] for result in created])
+                 .order_by('pk').values_list('description', flat=True)),
+            ['New cap', 'Second cap'],
+        )
+        self.assertEqual(response.data['update'], [{'status': 200, 'data': ProductSerializer(
+            Product.objects.get(pk=self.cap.pk)).data}])
+        self.assertEqual(response.data['update'][0]['data']['price'], 15)
+        self.assertEqual(response.data['delete'], [{'status': 204, 'id': self.other.pk}])
+        self.assertFalse(Product.objects.filter(pk=self.other.pk).exists())
+        self.assertEqual(Cart.objects.values_list('item_count', 'total_amount').get(pk=cart.pk), (1, 10))
+        self.assertEqual(self.client.get('/product/search/?q=second').data['results'][0]['id'],
+                         created[1]['data']['id'])
+
+    def test_atomic_batch_writes_nothing_on_error(self):
+        batch = {
+            'create': [self.new_product(), self.new_product(main_colour='purple')],
+            'update': [{'id': self.cap.pk, 'price': 15}, {'id': 999, 'price': 1}],
+            'delete': [self.other.pk],
+        }
+        response = self.client.post('/product/batch/', batch, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.data['create']], [424, 400])
+        self.assertIn('main_colour', response.data['create'][1]['errors'])
+        self.assertEqual([result['status'] for result in response.data['update']], [424, 404])
+        self.assertEqual(Product.objects.count(), 2)
+        self.cap.refresh_from_db()
+        self.assertEqual(self.cap.price, 10)
+
+        batch['atomic'] = False
+        response = self.client.post('/product/batch/', batch, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['create']], [201, 400])
+        self.assertEqual([result['status'] for result in response.data['update']], [200, 404])
+        self.assertEqual(response.data['delete'], [{'status': 204, 'id': self.other.pk}])
+        self.cap.refresh_from_db()
+        self.assertEqual(self.cap.price, 15)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_invalid_batch(self):
+        self.assertEqual(self.client.post('/product/batch/', {'create': {}}, format='json').status_code, 400)
+        with self.settings(PRODUCT_BATCH_MAX_SIZE=1):
+            response = self.client.post('/product/batch/', {'delete': [1, 2]}, format='json')
+        self.assertEqual(response.status_code, 400)
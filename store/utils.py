@@ -1,18 +1,47 @@
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db.models import F, Q, Sum
 
-from .models import Cart, CartItem
-from .serializers import CartItemSerializer
-
-
-def send_mail_customer(customer_cart):
-    cart = Cart.objects.filter(id=customer_cart.id).first()
-    purchase = CartItem.objects.filter(cart=cart.id).first()
-    items = CartItemSerializer(purchase).data
-    message = f"You have made a purchase of {items['sub_total']}€."
-    send_mail(
-        subject="The summary of your purchase",
-        message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[customer_cart.email]
-    )
+from .models import CartItem, Customer, OutboxEmail
+
+SUMMARY_SUBJECT = "The summary of your purchase"
+
+
+def purchase_summary(cart_id):
+    # Every line comes from one GROUP BY over the cart items, and the total is their sum.
+    rows = list(CartItem.objects.filter(cart_id=cart_id).values('product_id', 'product__description').annotate(
+        units=Sum('quantity'),
+        sub_total=Sum(F('quantity') * F('product__price')),
+    ).order_by('product__description', 'product_id'))
+    lines = [f"{row['units']} x {row['product__description']}: {row['sub_total']:.2f}€" for row in rows]
+    total = sum(row['sub_total'] for row in rows)
+    return "\n".join(lines + ["", f"You have made a purchase of {total:.2f}€."])
+
+
+def cart_customer(cart):
+    condition = Q(cart_id=cart.pk)
+    kind, _, key = cart.owner.partition(':')
+    if kind == 'customer' and key.isdigit():
+        condition |= Q(pk=int(key))
+    return Customer.objects.filter(condition).order_by('pk').first()
+
+
+def send_mail_customer(customer, cart=None):
+    """
+    Queues the purchase summary of the cart (the customer's cart by default) in the outbox.
+    It is written in the caller's transaction and sent by the send_outbox command.
+    """
+    cart_id = cart.pk if cart is not None else customer.cart_id
+    email, _ = OutboxEmail.objects.get_or_create(cart_id=cart_id, defaults={
+        'from_email': settings.EMAIL_HOST_USER,
+        'to': customer.email,
+        'subject': SUMMARY_SUBJECT,
+        'body': purchase_summary(cart_id),
+    })
+    return email
+
+
+def enqueue_purchase_summary(cart):
+    customer = cart_customer(cart)
+    if customer is None:
+        return None
+    return send_mail_customer(customer, cart)
@@ -1,44 +1,361 @@
-from rest_framework import viewsets
-from rest_framework.generics import RetrieveAPIView, DestroyAPIView, RetrieveUpdateAPIView
+import calendar
+import hashlib
 
+from django.conf import settings
+from django.db import transaction
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
+from django.utils.text import compress_sequence
+from django.utils import timezone
+from django.views import View
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.generics import RetrieveAPIView, DestroyAPIView, RetrieveUpdateAPIView, get_object_or_404
+from rest_framework.response import Response
+
+from .cache import catalog_cache
+from .export import EXPORT_FORMATS, export_chunks
+from .fast import compile_serializer
+from .filters import ProductFilterBackend, facet_counts, get_ordering, parse_bool
+from .metrics import CONTENT_TYPE, metrics
 from .models import Product, Category, Cart, CartItem, Customer
+from .routers import read_from_replicas, reading_from_replica
+from .search import search_product_ids
 from .serializers import CategorySerializer, ProductSerializer, CartSerializer, CartItemSerializer, \
-    AddCartItemSerializer, CustomerSerializer
+    AddCartItemSerializer, CustomerSerializer, plan_queryset
+from .sqlite import immediate
+from .stock import delete_products, settle_cart
+from .utils import enqueue_purchase_summary
+
+
+class QueryPlanMixin:
+    # Loads exactly what the serializer reads, so list endpoints run a fixed number of queries.
+    # Writes load whole rows, so that save() also stores fields the serializer leaves out.
+    # planned=False skips the plan, for queries that serialize nothing.
+    def get_queryset(self, planned=True):
+        if not planned:
+            return super().get_queryset()
+        only = self.request is None or self.request.method in SAFE_METHODS
+        return plan_queryset(super().get_queryset(), self.get_serializer_class(), only)
+
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match / If-Modified-Since with 304 before any serializer runs. The
+    validators come from the keys and the latest `validator_fields` of the rows served,
+    read without the query plan, so a list request only reads its own page. Each field
+    has one value per row: related rows are summed up by an annotation.
+    """
+    validator_fields = ('updated',)
+    # {validator field: queryset method that annotates it}, as the serializers' Meta.annotations.
+    validator_annotations = {}
+
+    def get_validator_queryset(self):
+        queryset = self.get_queryset(planned=False)
+        for method in self.validator_annotations.values():
+            queryset = getattr(queryset, method)()
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_validator_queryset()).values_list('pk', *self.validator_fields)
+        if self.paginator is not None:
+            queryset = self.paginator.page_queryset(queryset, request, self)
+        rows = list(queryset)
+        validators = {'keys': [row[0] for row in rows]}
+        for index, field in enumerate(self.validator_fields, 1):
+            values = [row[index] for row in rows if row[index] is not None]
+            validators[field] = max(values) if values else None
+        return self.conditional_response(
+            request, validators, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            row = self.get_validator_queryset().filter(pk=pk).values_list(*self.validator_fields).first()
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)
+        validators = dict(zip(self.validator_fields, row))
+        return self.conditional_response(
+            request, validators, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def conditional_response(self, request, validators, get_response):
+        dates = [validators[field] for field in self.validator_fields if validators[field] is not None]
+        last_modified = calendar.timegm(max(dates).utctimetuple()) if dates else None
+        tag = '|'.join([request.get_full_path(), request.META.get('HTTP_ACCEPT', '')] +
+                       [str(validators[key]) for key in sorted(validators)])
+        etag = quote_etag(hashlib.md5(tag.encode('utf-8')).hexdigest())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ReplicaReadMixin:
+    # List and detail reads may be served by a replica database, see store.routers.
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions and request.method in SAFE_METHODS:
+            read_from_replicas()
+
 
+class CatalogCacheMixin:
+    # Serves list and detail responses from the catalog cache; writes bump its versions.
+    # Responses read from a replica may miss the latest write, so they expire after the lag.
+    @staticmethod
+    def cache_timeout():
+        return settings.DATABASE_REPLICA_LAG_SECONDS if reading_from_replica() else DEFAULT_TIMEOUT
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        key, data = catalog_cache.get_list(request.get_full_path())
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            catalog_cache.set_list(key, data, self.cache_timeout())
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        data = catalog_cache.get_product(pk)
+        if data is None:
+            try:
+                category_id = self.get_queryset().filter(pk=pk).values_list('category_id', flat=True).first()
+            except (TypeError, ValueError):
+                return super().retrieve(request, *args, **kwargs)
+            version = catalog_cache.product_version(category_id)
+            data = super().retrieve(request, *args, **kwargs).data
+            catalog_cache.set_product(pk, category_id, version, data, self.cache_timeout())
+        return Response(data)
+
+
+class CompiledListMixin:
+    # Builds list responses from values_list() rows with the compiled serializer (store/fast.py),
+    # skipping model instances and DRF fields. Serializers that cannot be compiled use the usual path.
+    def list(self, request, *args, **kwargs):
+        compiled = compile_serializer(self.get_serializer_class())
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+        ordering = getattr(self.paginator, 'get_ordering', lambda request, view: ())(request, self)
+        rows = compiled.rows(self.filter_queryset(self.get_queryset()), [field.lstrip('-') for field in ordering])
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.data(page))
+        return Response(compiled.data(rows))
+
+
+class CategoryViewSet(ReplicaReadMixin, ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    keyset_ordering = ('id',)
+
+
+class ProductDeleteMixin:
+    # Products go through delete_products, which fixes the carts holding them in one grouped UPDATE.
+    def perform_destroy(self, instance):
+        delete_products([instance.pk])
 
 
-class ProductViewSet(viewsets.ModelViewSet, RetrieveAPIView):
+class ProductViewSet(ReplicaReadMixin, ConditionalGetMixin, CatalogCacheMixin, CompiledListMixin, ProductDeleteMixin,
+                     QueryPlanMixin, viewsets.ModelViewSet, RetrieveAPIView):
     queryset = Product.objects.all().order_by('category')
     serializer_class = ProductSerializer
+    filter_backends = [ProductFilterBackend]
+    # Stock movements do not write the product row, so the latest one is a validator too.
+    validator_fields = ('updated', 'category__updated', 'stock_moved')
+    validator_annotations = {'stock_moved': 'with_stock_moved'}
+    keyset_ordering = ('category_id', 'id')
+
+    def get_keyset_ordering(self, request):
+        return get_ordering(request, self.keyset_ordering)
+
+    # /product/search/?q=nik+cap: full-text search over description and brand, best match first.
+    @action(detail=False)
+    def search(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), settings.PAGINATION_MAX_PAGE_SIZE)
+        except ValueError:
+            limit = 20
+        ids = search_product_ids(request.query_params.get('q', ''), max(limit, 1))
+        products = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([products[pk] for pk in ids if pk in products], many=True)
+        return Response({'results': serializer.data})
+
+    # POST /product/batch/ {"create": [{...}], "update": [{"id": 1, ...}], "delete": [2, 3], "atomic": true}
+    # writes everything in one transaction with bulk queries and answers one result per item.
+    # An atomic batch (the default) writes nothing if any item fails; otherwise the valid
+    # items are written and the others reported.
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        creates, updates, deletes, atomic = self.get_batch(request.data)
+
+        with transaction.atomic():
+            create = self.get_serializer(data=creates, many=True)
+            create.is_valid()
+            results = {'create': [{'status': 400, 'errors': errors} if errors else None
+                                  for _, errors in create.item_results]}
+            update, results['update'] = self.validate_updates(updates)
+            delete_ids, results['delete'] = self.validate_deletes(deletes)
+
+            failed = any(result is not None for items in results.values() for result in items)
+            if atomic and failed:
+                for items in results.values():
+                    items[:] = [result or {'status': status.HTTP_424_FAILED_DEPENDENCY} for result in items]
+                return Response(results, status=status.HTTP_400_BAD_REQUEST)
+
+            created = iter(self.get_serializer(
+                create.create([attrs for attrs, errors in create.item_results if not errors]), many=True).data)
+            results['create'] = [result or {'status': 201, 'data': next(created)} for result in results['create']]
 
+            valid = [(product, attrs) for product, (attrs, errors) in zip(update.instance, update.item_results)
+                     if not errors]
+            updated = iter(self.get_serializer(
+                update.update([product for product, _ in valid], [attrs for _, attrs in valid]), many=True).data)
+            results['update'] = [result or {'status': 200, 'data': next(updated)} for result in results['update']]
 
-class ProductUpdate(RetrieveUpdateAPIView):
+            delete_products([pk for pk, result in zip(delete_ids, results['delete']) if result is None])
+            results['delete'] = [result or {'status': 204, 'id': pk}
+                                 for pk, result in zip(delete_ids, results['delete'])]
+
+        return Response(results, status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_200_OK)
+
+    def validate_updates(self, updates):
+        ids = [self.batch_id(item.get('id') if isinstance(item, dict) else None) for item in updates]
+        products = self.get_queryset().select_for_update().in_bulk([pk for pk in ids if pk is not None])
+        results, pending, seen = [], [], set()
+        for index, pk in enumerate(ids):
+            results.append(self.missing_or_duplicated(pk, products, seen))
+            if results[-1] is None:
+                pending.append(index)
+
+        update = self.get_serializer([products[ids[index]] for index in pending],
+                                     data=[updates[index] for index in pending], many=True, partial=True)
+        update.is_valid()
+        for index, (_, errors) in zip(pending, update.item_results):
+            if errors:
+                results[index] = {'status': 400, 'errors': errors}
+        return update, results
+
+    def validate_deletes(self, deletes):
+        ids = [self.batch_id(pk) for pk in deletes]
+        existing = set(Product.objects.filter(pk__in=[pk for pk in ids if pk is not None]).values_list('pk', flat=True))
+        seen = set()
+        return ids, [self.missing_or_duplicated(pk, existing, seen) for pk in ids]
+
+    @staticmethod
+    def missing_or_duplicated(pk, existing, seen):
+        if pk not in existing:
+            return {'status': 404, 'errors': {'id': ["Not found."]}}
+        if pk in seen:
+            return {'status': 400, 'errors': {'id': ["Duplicated in the batch."]}}
+        seen.add(pk)
+        return None
+
+    @staticmethod
+    def get_batch(data):
+        if not isinstance(data, dict):
+            raise ValidationError({'non_field_errors': ["Expected an object with create, update and delete lists."]})
+        lists = {}
+        for name in ('create', 'update', 'delete'):
+            lists[name] = data.get(name, [])
+            if not isinstance(lists[name], list):
+                raise ValidationError({name: ["Expected a list."]})
+        size = sum(len(items) for items in lists.values())
+        if size > settings.PRODUCT_BATCH_MAX_SIZE:
+            raise ValidationError({'non_field_errors': [
+                f"At most {settings.PRODUCT_BATCH_MAX_SIZE} operations per batch, got {size}."]})
+        atomic = parse_bool('atomic', str(data.get('atomic', True)))
+        return lists['create'], lists['update'], lists['delete'], atomic
+
+    @staticmethod
+    def batch_id(value):
+        return value if type(value) is int else None
+
+    # ?facets=true adds the number of matching products per filter value.
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if parse_bool('facets', self.request.query_params.get('facets', 'false')):
+            response.data['facets'] = facet_counts(self.filter_queryset(self.get_queryset()))
+        return response
+
+
+class ProductUpdate(QueryPlanMixin, RetrieveUpdateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
 
-class ProductDelete(DestroyAPIView):
+class ProductDelete(ProductDeleteMixin, QueryPlanMixin, DestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
 
-class CartViewSet(viewsets.ModelViewSet, RetrieveAPIView):
+class CartCompletionMixin:
+    # Completing a cart sells its stock (see settle_cart) and queues its purchase summary in
+    # the outbox, in the same transaction. A completed cart stays completed: its stock is sold.
+    def perform_update(self, serializer):
+        with immediate():
+            was_completed = Cart.objects.select_for_update().filter(pk=serializer.instance.pk).values_list(
+                'completed', flat=True).get()
+            if was_completed and not serializer.validated_data.get('completed', True):
+                raise ValidationError({'completed': ["A completed cart cannot be reopened."]})
+            cart = serializer.save()
+            if cart.completed and not was_completed:
+                settle_cart(cart.pk)
+                enqueue_purchase_summary(cart)
+
+
+class CartViewSet(ConditionalGetMixin, CartCompletionMixin, QueryPlanMixin, viewsets.ModelViewSet, RetrieveAPIView):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
+    # Cart lines show the current product description and price.
+    validator_fields = ('updated', 'products_updated')
+    validator_annotations = {'products_updated': 'with_products_updated'}
+    keyset_ordering = ('created', 'id')
+
+    # New carts belong to the shopper's session, which can hold one active cart at a time.
+    def perform_create(self, serializer):
+        if not self.request.session.session_key:
+            self.request.session.save()
+        serializer.save(owner=Cart.session_owner(self.request.session.session_key))
 
+    # POST /carts/<id>/checkout/ locks the cart, checks and sells its lines, completes it and
+    # queues its purchase summary in one transaction, with the same queries for any number of lines.
+    @action(detail=True, methods=['post'])
+    def checkout(self, request, pk=None):
+        with immediate():
+            cart = get_object_or_404(Cart.objects.select_for_update(), pk=pk)
+            self.check_object_permissions(request, cart)
+            if cart.completed:
+                raise ValidationError("This cart is already completed.")
+            settle_cart(cart.pk)
+            Cart.objects.filter(pk=cart.pk).update(completed=True, updated=timezone.now())
+            cart.completed = True
+            enqueue_purchase_summary(cart)
+        return Response(self.get_serializer(self.get_queryset().get(pk=cart.pk)).data)
 
-class CartUpdate(RetrieveUpdateAPIView):
+
+class CartUpdate(CartCompletionMixin, QueryPlanMixin, RetrieveUpdateAPIView):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(QueryPlanMixin, viewsets.ModelViewSet):
+    queryset = CartItem.objects.all()
+
     def get_queryset(self):
-        return CartItem.objects.filter(cart_id=self.kwargs["cart_pk"])
+        return super().get_queryset().filter(cart_id=self.kwargs["cart_pk"])
 
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -50,6 +367,54 @@ class CartItemViewSet(viewsets.ModelViewSet):
         return {"cart_id": self.kwargs["cart_pk"]}
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    keyset_ordering = ('id',)
+
+
+class ExportView(View):
+    """
+    Streams a whole table as NDJSON or CSV from a chunked iterator, so memory does not grow
+    with the table. The output is gzip compressed on the fly when the client accepts it.
+    """
+    export = None
+    staff_only = False
+
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        if self.staff_only and not request.user.is_staff:
+            return HttpResponseForbidden()
+
+        response = StreamingHttpResponse(export_chunks(self.export, export_format),
+                                         content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.export}.{export_format}"'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response.streaming_content = compress_sequence(response.streaming_content)
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+
+class CatalogExport(ExportView):
+    export = 'catalog'
+
+
+class OrderExport(ExportView):
+    export = 'orders'
+    staff_only = True
+
+
+class MetricsView(View):
+    """
+    Request metrics in Prometheus text format, see store.metrics. Served to staff users and,
+    when METRICS_TOKEN is set, to scrapers that send it as a bearer token.
+    """
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        scraper = token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+        if not scraper and not request.user.is_staff:
+            return HttpResponseForbidden()
+        return HttpResponse(metrics.render(), content_type=CONTENT_TYPE)